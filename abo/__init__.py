@@ -1,6 +1,8 @@
 from . import settings
 from django.core.exceptions import ImproperlyConfigured
 
+default_app_config = 'abo.apps.AboConfig'
+
 
 def get_plan_model():
     """
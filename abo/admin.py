@@ -1,7 +1,11 @@
 from django.contrib import admin
+from django.core.paginator import Paginator, Page, EmptyPage, PageNotAnInteger
+from django.db import connections
+from django.utils.translation import ugettext_lazy as _
 
 from .models import BackendClient, BackendPayment, BackendPlan, BackendSubscription, BackendEvent
-from . import get_subscription_model, get_plan_model
+from .registry import backends
+from . import settings, get_subscription_model, get_plan_model, catalog
 
 Subscription = get_subscription_model()
 Plan = get_plan_model()
@@ -13,9 +17,108 @@ class PlanAdmin(admin.ModelAdmin):
     search_fields = ('name', 'amount')
 
 
-class SubscriptionAdmin(admin.ModelAdmin):
+def estimate_count(queryset, limit):
+    """
+    Returns the number of rows of `queryset`, but counts at most `limit` rows. For an unfiltered table on PostgreSQL
+    the planner's estimate is used instead if it is larger.
+    """
+    connection = connections[queryset.db]
+    if not queryset.query.where and connection.vendor == 'postgresql':
+        cursor = connection.cursor()
+        cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+        if row is not None and row[0] > limit:
+            return int(row[0])
+    return queryset.order_by().values('pk')[:limit].count()
+
+
+class EstimatedPage(Page):
+    """Page of an EstimatedCountPaginator, has_next() tells whether more rows follow instead of trusting the count"""
+    def __init__(self, object_list, number, paginator, more):
+        super(EstimatedPage, self).__init__(object_list, number, paginator)
+        self.more = more
+
+    def has_next(self):
+        return self.more
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for big tables: the count is approximate, at most ABO_ADMIN_COUNT_LIMIT or the planner's estimate (see
+    estimate_count()), and pages beyond it can still be opened as long as they have rows. A page first skips the rows
+    before it on the primary keys only, then loads the rows of the page by primary key. Skipping reads the index
+    instead of whole rows.
+    """
+    def _get_count(self):
+        if self._count is None:
+            self._count = estimate_count(self.object_list, settings.ABO_ADMIN_COUNT_LIMIT)
+        return self._count
+    count = property(_get_count)
+
+    def validate_number(self, number):
+        """Accepts every page number from 1 on, the count can't tell where the last page is"""
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        # one more to find out whether there is a next page
+        pks = list(self.object_list.values_list('pk', flat=True)[bottom:bottom + self.per_page + 1])
+        if not pks and (number > 1 or not self.allow_empty_first_page):
+            raise EmptyPage('That page contains no results')
+        return EstimatedPage(self.object_list.filter(pk__in=pks[:self.per_page]), number, self, len(pks) > self.per_page)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin for tables with millions of rows: no exact counts and cheap pages. Use filters on indexed columns or
+    with a fixed list of values only, Django's filter for other columns runs a DISTINCT over the whole table.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # Django >= 1.8
+
+
+class PlanListFilter(admin.SimpleListFilter):
+    """Filters on the plan with the plans of the catalog, instead of querying them"""
+    title = _('plan')
+    parameter_name = 'plan'
+
+    def lookups(self, request, model_admin):
+        return [(plan.pk, plan) for plan in catalog.get_plans(hidden=True)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(plan=self.value())
+        return queryset
+
+
+class EventTypeListFilter(admin.SimpleListFilter):
+    """Filters on the event types the registered backends handle, instead of querying them"""
+    title = _('event type')
+    parameter_name = 'event_type'
+
+    def lookups(self, request, model_admin):
+        event_types = set()
+        for handlers in backends.event_handlers.values():
+            event_types.update(handlers)
+        return [(event_type, event_type) for event_type in sorted(event_types)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(event_type=self.value())
+        return queryset
+
+
+class SubscriptionAdmin(LargeTableAdmin):
     list_display = ('plan', 'quantity', 'total', 'currency', 'deleted')
-    list_filter = ('plan', 'quantity', 'currency', 'deleted')
+    list_filter = (PlanListFilter, 'deleted')
+    list_select_related = ('plan', )
 
 
 admin.site.register(Plan, PlanAdmin)
@@ -37,14 +140,22 @@ class BackendPlanAdmin(admin.ModelAdmin):
     list_filter = ('backend', )
 
 
-class BackendSubscriptionAdmin(admin.ModelAdmin):
-    list_display = ('backend', 'created_at', 'status')
-    list_filter = ('backend', )
+class BackendSubscriptionAdmin(LargeTableAdmin):
+    list_display = ('backend', 'created_at', 'subscription', 'status')
+    list_filter = ('backend', 'status')
+    list_select_related = ('subscription__plan', )
+    raw_id_fields = ('subscription', 'backend_plan', 'backend_payment', 'client')
 
 
-class BackendEventAdmin(admin.ModelAdmin):
+class BackendEventAdmin(LargeTableAdmin):
     list_display = ('backend', 'created_at', 'event_type', 'processed')
-    list_filter = ('backend', 'processed', 'event_type')
+    list_filter = ('backend', 'processed', EventTypeListFilter)
+    raw_id_fields = ('content_type', )
+
+    def get_queryset(self, request):
+        # the payloads are only needed on the change page
+        return super(BackendEventAdmin, self).get_queryset(request).defer('message')
+
 
 admin.site.register(BackendClient, BackendClientAdmin)
 admin.site.register(BackendPayment, BackendPaymentAdmin)
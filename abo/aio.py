@@ -0,0 +1,76 @@
+"""
+asyncio interface of django-abo, for ASGI deployments on Python >= 3.4.
+
+Django's ORM and the gateway clients are synchronous, so blocking work runs on
+a process-wide thread pool of ABO_ASYNC_THREADS threads and is returned as an
+asyncio future. The event loop is never blocked and the number of threads
+doesn't grow with the number of concurrent requests. This is not native async
+I/O: every call in flight still occupies a thread for its whole duration, a
+checkout for all of its gateway calls. At most ABO_ASYNC_THREADS calls run at
+the same time per process, the others wait in the pool's queue:
+
+    url, method, params = await PaymentProcessor.get_gateway_url_async(request)
+    offer = await AsyncClient(gateway.get_client(pymill.Pymill)).new_offer(...)
+
+This module uses no async/await syntax so it can be shipped with the Python 2
+code, but it can only be imported where asyncio exists.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from . import settings
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(settings.ABO_ASYNC_THREADS)
+    return _executor
+
+
+def _call(fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        # like at the end of a request, the threads are reused
+        close_old_connections()
+
+
+def run(fn, *args, **kwargs):
+    """Calls `fn` on the thread pool and returns a future of its result"""
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(get_executor(), functools.partial(_call, fn, args, kwargs))
+
+
+def done(value):
+    """Returns a future that already has `value`, for work that doesn't block"""
+    future = asyncio.Future()
+    future.set_result(value)
+    return future
+
+
+class AsyncClient(object):
+    """
+    Proxy for a gateway client whose public methods return futures.
+    """
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return run(attr, *args, **kwargs)
+        call.__name__ = name
+        return call
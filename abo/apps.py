@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class AboConfig(AppConfig):
+    name = 'abo'
+    verbose_name = 'Abo'
+
+    def ready(self):
+        from .registry import backends
+        from . import offers  # noqa, connects the cache invalidation
+        from . import catalog  # noqa, connects the catalog versioning
+        from . import metrics  # noqa, connects the timing signals
+        from . import entitlements  # noqa, connects the entitlement updates
+        from . import revenue  # noqa, connects the revenue rollups
+        backends.populate()
@@ -0,0 +1,128 @@
+"""
+Archival of processed BackendEvents into gzip compressed JSON lines files.
+
+Every line of an archive file is one event, with the same fields as the
+BackendEvent model ("content_type" is the id of the content type). Archives
+can be read back with read_archive() without loading them into the DB.
+"""
+import os
+import gzip
+import logging
+
+import six
+
+from .fields import dumps, loads
+from .models import BackendEvent
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FIELDS = ('id', 'backend', 'external_id', 'created_at', 'event_type', 'livemode', 'digest',
+                  'processed', 'content_type', 'object_id', 'message')
+
+
+class ArchiveSegment(object):
+    """
+    A single archive file. It is written to a temporary name and only renamed
+    to its final name once it has been completely written to disk.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.pks = []
+        self.raw = open(path + '.tmp', 'wb')
+        self.file = gzip.GzipFile(fileobj=self.raw, mode='wb')
+
+    def write(self, pk, line):
+        self.file.write(line.encode('utf-8'))
+        self.pks.append(pk)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        self.raw.close()
+        os.rename(self.path + '.tmp', self.path)
+
+
+class EventArchiver(object):
+    """
+    Moves processed events created before `before` into archive files in `directory`.
+
+    Events are read in batches of `batch_size` by primary key, so memory use
+    doesn't depend on the size of the table. Every file holds at most
+    `max_events` events. The rows of a file are deleted, again in batches of
+    `batch_size`, once the file is safely on disk.
+    """
+    def __init__(self, directory, before, batch_size=1000, max_events=100000):
+        self.directory = directory
+        self.before = before
+        self.batch_size = batch_size
+        self.max_events = max_events
+
+    def get_queryset(self):
+        return BackendEvent.objects.filter(processed=True, created_at__lt=self.before)
+
+    def run(self):
+        """Archives the events and returns the paths of the files that were written"""
+        paths = []
+        segment = None
+        last_pk = 0
+
+        while True:
+            rows = list(self.get_queryset().filter(pk__gt=last_pk).order_by('pk').values_list(*ARCHIVE_FIELDS)[:self.batch_size])
+            if not rows:
+                break
+
+            for row in rows:
+                if segment is None:
+                    segment = self.open_segment(row[0])
+                segment.write(row[0], self.serialize(row))
+
+                if segment.count >= self.max_events:
+                    paths.append(self.close_segment(segment))
+                    segment = None
+
+            last_pk = rows[-1][0]
+
+        if segment is not None:
+            paths.append(self.close_segment(segment))
+        return paths
+
+    def open_segment(self, first_pk):
+        name = 'events-%s-%s.jsonl.gz' % (self.before.strftime('%Y%m%d'), first_pk)
+        return ArchiveSegment(os.path.join(self.directory, name))
+
+    def close_segment(self, segment):
+        segment.close()
+        for i in range(0, len(segment.pks), self.batch_size):
+            BackendEvent.objects.filter(pk__in=segment.pks[i:i + self.batch_size]).delete()
+        logger.info('Archived %s events to %s', segment.count, segment.path)
+        return segment.path
+
+    def serialize(self, row):
+        data = dict(zip(ARCHIVE_FIELDS, row))
+        message = data.pop('message')
+
+        # the message is written as it was stored, without decoding it
+        if not isinstance(message, six.string_types):
+            message = dumps(message)
+        message = ' '.join((message or '{}').splitlines())
+
+        return u'%s, "message": %s}\n' % (dumps(data)[:-1], message)
+
+
+def read_archive(paths):
+    """
+    Yields the events in one or more archive files as dicts, one at a time.
+    """
+    if isinstance(paths, six.string_types):
+        paths = [paths]
+
+    for path in paths:
+        archive = gzip.open(path, 'rb')
+        try:
+            for line in archive:
+                yield loads(line)
+        finally:
+            archive.close()
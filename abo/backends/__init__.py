@@ -1,5 +1,5 @@
 from django.core.exceptions import ImproperlyConfigured
-from abo.utils import get_backend_settings
+from abo.registry import backends
 
 
 class PaymentProcessorBase(object):
@@ -36,6 +36,15 @@ class PaymentProcessorBase(object):
         """
         raise NotImplementedError('Must be implemented in PaymentProcessor')
 
+    @classmethod
+    def get_gateway_url_async(cls, request):
+        """
+        asyncio variant of get_gateway_url, returns a future of its result (Python >= 3.4 only, see abo.aio).
+        Backends can override it if they don't block.
+        """
+        from abo import aio
+        return aio.run(cls.get_gateway_url, request)
+
     @classmethod
     def get_form(cls, post_data):
         """
@@ -53,7 +62,7 @@ class PaymentProcessorBase(object):
         If `default` value is omitted, raises ``ImproperlyConfigured`` when
         setting ``name`` is not available.
         """
-        backend_settings = get_backend_settings(cls.BACKEND)
+        backend_settings = backends.get_settings(cls.BACKEND)
         if default is not None:
             return backend_settings.get(name, default)
         else:
@@ -16,3 +16,8 @@ class PaymentProcessor(PaymentProcessorBase):
     @classmethod
     def get_gateway_url(cls, request):
         return reverse('abo-paymill-authorization'), "GET", {}
+
+    @classmethod
+    def get_gateway_url_async(cls, request):
+        from abo import aio
+        return aio.done(cls.get_gateway_url(request))
@@ -0,0 +1,39 @@
+"""
+asyncio variants of the paymill checkout and webhook, see abo.aio.
+
+    subscription = await aio.checkout(plan, quantity, email, token, on_error)
+    status = await aio.handle_webhook(message)
+"""
+import pymill
+
+from abo import aio
+from abo.models import BackendEvent
+
+from . import PaymentProcessor, gateway
+from .checkout import Checkout
+from .views import is_valid_message
+
+
+def checkout(plan, quantity, email, token, on_error, pymill_class=pymill.Pymill):
+    """
+    Subscribes a customer to a plan like PaymillForm, returns a future of the
+    subscription. `on_error` is called with the exception of a failed gateway
+    call and has to raise.
+    """
+    def run():
+        return Checkout(gateway.get_client(pymill_class), on_error=on_error).run(plan, quantity, email, token)
+    return aio.run(run)
+
+
+def handle_webhook(message):
+    """
+    Queues the event of a decoded webhook request like the webhook view,
+    returns a future of the HTTP status to answer with.
+    """
+    if not is_valid_message(message):
+        return aio.done(400)
+
+    def queue():
+        BackendEvent.objects.queue(PaymentProcessor.BACKEND, message, message["event"]["event_type"])
+        return 200
+    return aio.run(queue)
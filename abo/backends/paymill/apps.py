@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class PaymillConfig(AppConfig):
     name = 'abo.backends.paymill'
     verbose_name = 'Paymill Payment Backend'
+
+    def ready(self):
+        from abo.registry import backends
+        from .events import EventProcessor
+        backends.register(self.module, event_processor=EventProcessor)
@@ -0,0 +1,380 @@
+"""
+The Paymill checkout: creates client, payment, offer and subscription on
+Paymill and saves them to the DB.
+
+Steps that don't depend on each other are run concurrently on a process-wide
+thread pool: client and payment (the payment needs the client) on one side,
+the offer on the other side. Only gateway calls run in the pool, the DB is
+only accessed from the calling thread.
+
+Gateway calls are made without a DB transaction: the result of every step is
+saved in its own short transaction and recorded in a PendingCheckout, so a
+checkout that died half way can be completed or compensated later by the
+recover_checkouts command (see Recovery). The checkout must therefore not be
+run inside a transaction, e.g. of ATOMIC_REQUESTS.
+
+Every step is timed, the timings are sent as checkout_step signals when the
+checkout is done.
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+
+import pymill
+from django.db import transaction
+
+from abo import get_subscription_model
+from abo.models import BackendPayment, BackendPlan, BackendSubscription, BackendClient, PendingCheckout
+from abo.circuit import is_transient
+from abo.offers import OfferResolver, OfferLocked
+from abo.signals import checkout_step
+
+from . import PaymentProcessor, gateway
+from .gateway import from_timestamp
+
+Subscription = get_subscription_model()
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Returns the thread pool for gateway calls, it has PAYMILL_CHECKOUT_THREADS threads.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPool(PaymentProcessor.get_backend_setting('PAYMILL_CHECKOUT_THREADS', 8))
+    return _pool
+
+
+class CallResult(object):
+    """
+    The result of a call that ran in the calling thread, with the interface of multiprocessing's AsyncResult.
+    """
+    def __init__(self, fn, args, kwargs):
+        self.value = self.error = None
+        try:
+            self.value = fn(*args, **kwargs)
+        except Exception as e:
+            self.error = e
+
+    def get(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def get_error(exception):
+    """Returns the error code and message of an exception raised by pymill"""
+    if len(exception.args) and type(exception.args[0]) == dict:
+        return exception.args[0].get('exception', 'error'), exception.args[0].get('error', 'Error')
+    return 'error', 'Error'
+
+
+def get_offer_kwargs(plan, quantity):
+    """Returns the arguments for pymill's new_offer() for `quantity` x `plan`"""
+    return dict(
+        amount=plan.amount * quantity,
+        interval="{} {}".format(
+            plan.interval_count or 1,
+            plan.interval),
+        name="{}, Quantity: {}".format(
+            plan.name,
+            quantity),
+        currency='EUR'
+    )
+
+
+def build_backend_plan(offer, plan, quantity):
+    """Returns an unsaved BackendPlan for an offer created on paymill"""
+    subscription_count = getattr(offer, 'subscription_count', {'active': None, 'inactive': None})
+
+    return BackendPlan(
+        backend=PaymentProcessor.BACKEND,
+        external_id=offer.id,
+        plan=plan,
+        quantity=quantity,
+        subscription_count_active=subscription_count.get('active'),
+        subscription_count_inactive=subscription_count.get('inactive'),
+        created_at=getattr(offer, 'created_at', datetime.now()),
+        updated_at=getattr(offer, 'updated_at', datetime.now())
+    )
+
+
+def save_backend_subscription(pending, external_id, created_at, updated_at):
+    """Saves the subscription created on paymill for `pending` and completes it"""
+    with transaction.atomic():
+        pending.backend_subscription = BackendSubscription.objects.create(
+            backend=pending.backend,
+            external_id=external_id,
+            subscription=pending.subscription,
+            backend_plan=pending.backend_plan,
+            backend_payment=pending.backend_payment,
+            client=pending.backend_client,
+            status='new',
+            created_at=created_at,
+            updated_at=updated_at,
+            # next_capture_at=subscription.next_capture_at, # TODO
+            # canceled_at=subscription.canceled_at # TODO
+        )
+        pending.state = 'completed'
+        pending.save()
+    return pending.backend_subscription
+
+
+def compensate(pending, error_code=''):
+    """Marks the local subscription of a failed checkout as deleted"""
+    with transaction.atomic():
+        if pending.subscription is not None:
+            pending.subscription.deleted = True
+            pending.subscription.save(update_fields=['deleted'])
+        pending.state = 'failed' if error_code else 'compensated'
+        pending.error_code = error_code
+        pending.save()
+
+
+class Checkout(object):
+    """
+    Subscribes a customer to a plan.
+
+    `paymill` is the gateway client. `on_error` is called with the exception of a
+    failed gateway call and has to raise. With `concurrent=False` all steps run
+    one after another in the calling thread.
+    """
+    def __init__(self, paymill, on_error, concurrent=True):
+        self.paymill = paymill
+        self.on_error = on_error
+        self.concurrent = concurrent
+        self.backend = PaymentProcessor.BACKEND
+        self.subscription = None
+        self.pending = None
+        # (step, duration, exception or None), appended from the pool threads too
+        self.timings = []
+
+    def record(self, step, duration, error=None):
+        self.timings.append((step, duration, error))
+
+    @contextmanager
+    def timed(self, step, offset=0):
+        """Records the duration of the block plus `offset` seconds as `step`"""
+        start = time.time()
+        try:
+            yield
+        except Exception as e:
+            self.record(step, offset + time.time() - start, e)
+            raise
+        self.record(step, offset + time.time() - start)
+
+    def send_timings(self):
+        timings, self.timings = self.timings, []
+        for step, duration, error in timings:
+            checkout_step.send(
+                sender=self.__class__,
+                backend=self.backend,
+                step=step,
+                duration=duration,
+                outcome='success' if error is None else 'error',
+                error_code=None if error is None else get_error(error)[0]
+            )
+
+    def submit(self, fn, *args, **kwargs):
+        if self.concurrent:
+            return get_pool().apply_async(fn, args, kwargs)
+        return CallResult(fn, args, kwargs)
+
+    def run(self, plan, quantity, email, token):
+        try:
+            return self.subscribe(plan, quantity, email, token)
+        finally:
+            self.send_timings()
+
+    def fail(self, error):
+        compensate(self.pending, get_error(error)[0])
+        self.on_error(error)
+
+    def subscribe(self, plan, quantity, email, token):
+        if transaction.get_connection().in_atomic_block:
+            logger.warning('Checkout inside a transaction, it stays open during all gateway calls')
+
+        self.pending = PendingCheckout.objects.create(backend=self.backend, plan=plan, quantity=quantity, email=email)
+
+        logger.debug('create client and payment (card/direct debit)')
+        client_result = self.submit(self.create_client_and_payment, email, token)
+
+        offer_result = offer_error = None
+        offer_lookup_start = time.time()
+        offers = OfferResolver(self.backend)
+        locked = False
+        backend_plan = offers.get(plan, quantity)
+        if backend_plan is None:
+            # only one checkout creates the offer for a new quantity, the others wait for it
+            locked = offers.acquire(plan, quantity)
+            backend_plan = offers.get(plan, quantity)
+            if backend_plan is None and not locked:
+                # still being created, a second offer would be left unused
+                offer_error = OfferLocked(plan, quantity)
+            elif backend_plan is None:
+                logger.debug('create offer on paymill')
+                offer_result = self.submit(self.create_offer, plan, quantity, time.time() - offer_lookup_start)
+            elif locked:
+                offers.release(plan, quantity)
+                locked = False
+        else:
+            logger.debug('offer already created, using it')
+        if offer_result is None:
+            self.record('offer', time.time() - offer_lookup_start, offer_error)
+
+        client = payment = offer = None
+        client_error = payment_error = None
+        try:
+            try:
+                client, payment, payment_error = client_result.get()
+            except Exception as e:
+                client_error = e
+            if offer_result is not None:
+                try:
+                    offer = offer_result.get()
+                except Exception as e:
+                    offer_error = e
+
+            # save everything that was created on paymill, even if another step failed
+            with transaction.atomic():
+                if client is not None:
+                    self.pending.backend_client = self.save_client(client, email)
+                if payment is not None:
+                    self.pending.backend_payment = self.save_payment(payment, self.pending.backend_client)
+                if offer is not None:
+                    backend_plan = offers.save(build_backend_plan(offer, plan, quantity))
+                self.pending.backend_plan = backend_plan
+                self.pending.save()
+        finally:
+            if locked:
+                offers.release(plan, quantity)
+
+        for error in (client_error, payment_error, offer_error):
+            if error is not None:
+                self.fail(error)
+
+        logger.debug('create subscription')
+
+        with self.timed('subscription'):
+            with transaction.atomic():
+                self.subscription = Subscription.objects.create(
+                    plan=plan,
+                    quantity=quantity,
+                    currency='EUR',
+                )
+                # from now on the subscription might exist on paymill, even if the call below fails
+                self.pending.subscription = self.subscription
+                self.pending.state = 'subscribing'
+                self.pending.save()
+
+        logger.debug('subscribe!')
+
+        backend_client = self.pending.backend_client
+        try:
+            with self.timed('gateway_subscription'):
+                subscription = self.paymill.new_subscription(
+                    client=backend_client.external_id,
+                    offer=backend_plan.external_id,
+                    payment=self.pending.backend_payment.external_id
+                )
+        except Exception as e:
+            if is_transient(e):
+                # paymill might have created it anyway, recover_checkouts finds out
+                self.on_error(e)
+            self.fail(e)
+
+        save_backend_subscription(self.pending, subscription.id, subscription.created_at, subscription.updated_at)
+
+        logger.info("successfuly subscribed %s to %s" % (backend_client, self.subscription))
+
+        return self.subscription
+
+    def create_client_and_payment(self, email, token):
+        """
+        Returns the client, the payment and the exception raised while creating
+        the payment, if any. An exception while creating the client is raised.
+        """
+        with self.timed('client'):
+            client = self.paymill.new_client(email=email)
+        try:
+            # new_card() also works for direct debit
+            with self.timed('card'):
+                payment = self.paymill.new_card(token=token, client=client.id)
+        except Exception as e:
+            return client, None, e
+        return client, payment, None
+
+    def create_offer(self, plan, quantity, lookup_duration):
+        """The offer step includes the time it took to find out that the offer is missing"""
+        with self.timed('offer', offset=lookup_duration):
+            return self.paymill.new_offer(**get_offer_kwargs(plan, quantity))
+
+    def save_client(self, client, email):
+        return BackendClient.objects.create(
+            backend=self.backend,
+            external_id=client.id,
+            created_at=client.created_at,
+            email=email
+        )
+
+    def save_payment(self, payment, backend_client):
+        return BackendPayment.objects.create(
+            backend=self.backend,
+            external_id=payment.id,
+            client=backend_client,
+            payment_type=payment.type,
+            card_type=payment.card_type,
+            holder=payment.card_holder or payment.holder,  # cc --> card_holder; dd --> holder
+            expire_month=payment.expire_month,
+            expire_year=payment.expire_year,
+            last4=payment.last4,
+            code=payment.code,
+            account=payment.account,
+            iban=payment.iban,
+            bic=payment.bic,
+            created_at=payment.created_at
+            # updated_at=payment.updated_at
+        )
+
+
+class Recovery(object):
+    """
+    Finishes checkouts that died half way, e.g. with their process.
+
+    A checkout that was creating the subscription on paymill is completed if
+    paymill has it, all others are compensated. `find_subscriptions(client_id)`
+    returns the subscriptions of a paymill client as dicts, it defaults to the
+    paymill REST API.
+    """
+    def __init__(self, find_subscriptions=None):
+        self.find_subscriptions = find_subscriptions or self.find_subscriptions_on_gateway
+
+    def find_subscriptions_on_gateway(self, client_id):
+        return gateway.get_subscriptions_of_client(gateway.get_client(pymill.Pymill), client_id)
+
+    def recover(self, pending):
+        """Returns the new state of `pending`"""
+        # without the client or the offer, paymill can't be asked
+        if pending.state == 'subscribing' and pending.backend_client is not None and pending.backend_plan is not None:
+            for item in self.find_subscriptions(pending.backend_client.external_id):
+                offer = item.get('offer')
+                offer_id = offer.get('id') if isinstance(offer, dict) else offer
+                if offer_id == pending.backend_plan.external_id and not BackendSubscription.objects.filter(
+                        backend=pending.backend, external_id=item['id']).exists():
+                    logger.info('Completing checkout %s with subscription %s', pending.pk, item['id'])
+                    save_backend_subscription(pending, item['id'], from_timestamp(item['created_at']), from_timestamp(item['updated_at']))
+                    return pending.state
+
+        logger.info('Compensating checkout %s', pending.pk)
+        compensate(pending)
+        return pending.state
@@ -1,33 +1,132 @@
+import logging
+
 from abo.models import BackendSubscription
+from abo.utils import bulk_update
+from abo.registry import backends
+from . import PaymentProcessor
+from .gateway import from_timestamp
 from .webhooks import WEBHOOK_EVENTS
 
+logger = logging.getLogger(__name__)
+
 
 class EventProcessor():
     """
     Handle the paymill events we received through a webhook
 
-    This will be used by BackendEvent.process()
+    This will be used by BackendEvent.process() for single events and by the
+    process_events command, through process_batch(), for many events at once.
     """
 
-    def __init__(self, backend_event):
+    def __init__(self, backend_event, subscriptions=None):
         self.backend_event = backend_event
         self.object = None
+        # the Subscription of self.object, if the event changed it
+        self.subscription = None
+        # BackendSubscriptions by external_id, prefetched by process_batch()
+        self.subscriptions = subscriptions
+
+    @classmethod
+    def process_batch(cls, backend_events):
+        """
+        Processes a list of BackendEvents with a number of queries that doesn't
+        grow with the number of events: all referenced BackendSubscriptions are
+        fetched with one query, the changes are applied in memory and written
+        back with bulk updates. The receivers of the signals sent for every
+        subscription whose state changed, like the entitlement updates, run
+        their own queries per changed subscription.
+
+        Returns the events that could not be processed. They are left untouched.
+        """
+        backend_events = [backend_event for backend_event in backend_events if not backend_event.processed]
+
+        external_ids = set(filter(None, [cls.get_subscription_id(backend_event) for backend_event in backend_events]))
+        subscriptions = {}
+        if external_ids:
+            subscriptions = dict(
+                (backend_subscription.external_id, backend_subscription)
+                for backend_subscription in BackendSubscription.objects.select_related('subscription').filter(
+                    backend=PaymentProcessor.BACKEND,
+                    external_id__in=external_ids
+                )
+            )
+
+        changed_objects = {}
+        changed_subscriptions = {}
+        processed = []
+        failed = []
+
+        for backend_event in backend_events:
+            processor = cls(backend_event, subscriptions)
+            try:
+                processor.handle()
+            except Exception:
+                logger.exception('Processing event %s failed', backend_event.pk)
+                failed.append(backend_event)
+                continue
+
+            if processor.object:
+                changed_objects[processor.object.pk] = processor.object
+            if processor.subscription:
+                changed_subscriptions[processor.subscription.pk] = processor.subscription
+
+            backend_event.processed = True
+            processed.append(backend_event)
+
+        bulk_update(changed_objects.values(), ['status', 'canceled_at'])
+        bulk_update(changed_subscriptions.values(), ['deleted'])
+        bulk_update(processed, ['processed', 'content_type', 'object_id'])
+
+        for obj in list(changed_objects.values()) + list(changed_subscriptions.values()):
+            obj.send_transitions()
+
+        return failed
+
+    @classmethod
+    def get_event_handlers(cls):
+        """
+        Returns the dispatch table event_type -> handler. The backend registry builds it once at startup.
+        """
+        handlers = {}
+        for event_type in WEBHOOK_EVENTS:
+            handlers[event_type] = getattr(cls, "_" + event_type.replace('.', '_'))
+        return handlers
+
+    @staticmethod
+    def get_subscription_id(backend_event):
+        """Returns the id of the paymill subscription an event refers to, if any"""
+        try:
+            return backend_event.message['event']['event_resource']['subscription']['id']
+        except (KeyError, TypeError):
+            return None
+
+    def get_subscription(self, external_id):
+        if self.subscriptions is None:
+            return BackendSubscription.objects.get(backend=PaymentProcessor.BACKEND, external_id=external_id)
+        try:
+            return self.subscriptions[external_id]
+        except KeyError:
+            raise BackendSubscription.DoesNotExist(external_id)
 
     def process(self):
+        self.handle()
+
+        if self.subscription:
+            self.subscription.save()
+        if self.object:
+            self.object.save()
+
+    def handle(self):
+        """Applies the event to self.object, without saving anything"""
         # TODO also handle errors in message
         event = self.backend_event.message.get('event')
 
-        if not self.backend_event.event_type in WEBHOOK_EVENTS:
+        try:
+            event_fn = backends.get_event_handlers(PaymentProcessor.BACKEND)[self.backend_event.event_type]
+        except KeyError:
             raise NotImplementedError(self.backend_event.event_type)
 
-        event_fn_name = self.backend_event.event_type.replace('.', '_')
-        event_fn = getattr(self, "_" + event_fn_name, None)
-
-        if event_fn:
-            event_fn(event)
-
-        if self.object:
-            self.object.save()
+        event_fn(self, event)
 
     def _chargeback_executed(self, event):
         raise NotImplementedError()
@@ -42,7 +141,7 @@ class EventProcessor():
         raise NotImplementedError()
 
     def _subscription_created(self, event):
-        self.object = BackendSubscription.objects.get(external_id=event['event_resource']['subscription']['id'])
+        self.object = self.get_subscription(event['event_resource']['subscription']['id'])
         self.backend_event.content_object = self.object
         self.object.status = 'in_progress'
 
@@ -50,9 +149,11 @@ class EventProcessor():
         raise NotImplementedError()
 
     def _subscription_deleted(self, event):
-        self.object.subscription.deleted = True
-        self.object.subscription.save()
-        self.object.canceled_at = event['event_resource']['subscription']['canceled_at']
+        self.object = self.get_subscription(event['event_resource']['subscription']['id'])
+        self.backend_event.content_object = self.object
+        self.subscription = self.object.subscription
+        self.subscription.deleted = True
+        self.object.canceled_at = from_timestamp(event['event_resource']['subscription']['canceled_at'])
 
     def _subscription_succeeded(self, event):
         self._subscription_created(event)
@@ -0,0 +1,132 @@
+"""
+Process-wide Paymill clients.
+
+Creating a pymill.Pymill for every call means a new HTTP session, so every
+checkout paid for new TCP and TLS handshakes. The clients returned by
+get_client() are shared by all threads of a process and keep their
+connections to Paymill alive. Their calls are traced, see abo.tracing, and
+guarded by a circuit breaker, see abo.circuit.
+"""
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from abo.circuit import CircuitBreaker, GuardedClient
+from abo.tracing import TracingClient, response_hook, trace
+
+from . import PaymentProcessor
+
+API_URL = 'https://api.paymill.com/v2/'
+
+_lock = threading.Lock()
+_clients = {}
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that applies a default timeout to every request
+    """
+    def __init__(self, timeout=None, *args, **kwargs):
+        self.timeout = timeout
+        super(TimeoutHTTPAdapter, self).__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super(TimeoutHTTPAdapter, self).send(request, **kwargs)
+
+
+def get_client(pymill_class):
+    """
+    Returns the shared client of `pymill_class`, which is pymill.Pymill or a mockup in tests.
+
+    The client's session keeps up to PAYMILL_POOL_SIZE connections open and
+    every request times out after PAYMILL_TIMEOUT seconds, which can also be a
+    (connect, read) tuple. `get_*` calls are retried up to PAYMILL_RETRIES
+    times, the circuit opens after PAYMILL_CIRCUIT_THRESHOLD failures for
+    PAYMILL_CIRCUIT_RESET seconds (all are backend settings).
+    """
+    private_key = PaymentProcessor.get_backend_setting('PAYMILL_PRIVATE_KEY')
+    key = (pymill_class, private_key)
+    try:
+        return _clients[key]
+    except KeyError:
+        with _lock:
+            if key not in _clients:
+                _clients[key] = create_client(pymill_class, private_key)
+        return _clients[key]
+
+
+def create_client(pymill_class, private_key):
+    client = pymill_class(private_key)
+
+    session = getattr(client, 'session', None)
+    if session is not None:
+        pool_size = PaymentProcessor.get_backend_setting('PAYMILL_POOL_SIZE', 10)
+        session.mount('https://', TimeoutHTTPAdapter(
+            timeout=PaymentProcessor.get_backend_setting('PAYMILL_TIMEOUT', 10),
+            pool_connections=pool_size,
+            pool_maxsize=pool_size
+        ))
+        session.hooks['response'].append(response_hook)
+
+    breaker = CircuitBreaker(
+        PaymentProcessor.BACKEND,
+        threshold=PaymentProcessor.get_backend_setting('PAYMILL_CIRCUIT_THRESHOLD', 5),
+        reset_timeout=PaymentProcessor.get_backend_setting('PAYMILL_CIRCUIT_RESET', 30)
+    )
+    return GuardedClient(
+        TracingClient(client, PaymentProcessor.BACKEND),
+        breaker,
+        retries=PaymentProcessor.get_backend_setting('PAYMILL_RETRIES', 2),
+        backoff=PaymentProcessor.get_backend_setting('PAYMILL_RETRY_BACKOFF', 0.1)
+    )
+
+
+def reset():
+    """Drops all clients, new ones are created on the next call of get_client()"""
+    with _lock:
+        _clients.clear()
+
+
+def iter_updated(client, resource, since, until, page_size=100):
+    """
+    Yields the objects of `resource` ('subscriptions', 'clients', 'payments'
+    or 'offers') as dicts that were updated between the unix timestamps `since`
+    and `until`, least recently updated first.
+    """
+    offset = 0
+    while True:
+        with trace(PaymentProcessor.BACKEND, 'list_' + resource):
+            response = client.session.get(API_URL + resource, params={
+                'count': page_size,
+                'offset': offset,
+                'order': 'updated_at_asc',
+                'updated_at': '%d-%d' % (since, until)
+            })
+            response.raise_for_status()
+        data = response.json().get('data') or []
+        for item in data:
+            yield item
+
+        if len(data) < page_size:
+            return
+        offset += page_size
+
+
+def get_subscriptions_of_client(client, client_id):
+    """Returns the subscriptions of the paymill client `client_id` as dicts"""
+    with trace(PaymentProcessor.BACKEND, 'list_subscriptions'):
+        response = client.session.get(API_URL + 'subscriptions', params={'client': client_id})
+        response.raise_for_status()
+    return response.json().get('data') or []
+
+
+def from_timestamp(value):
+    """paymill sends unix timestamps"""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(int(value), timezone.utc if settings.USE_TZ else None)
@@ -0,0 +1,138 @@
+import logging
+from optparse import make_option
+from multiprocessing.pool import ThreadPool
+
+import pymill
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction, IntegrityError
+
+from abo import get_plan_model
+from abo.models import BackendPlan
+from abo.offers import OfferResolver, LOCK_TIMEOUT
+from abo.backends.paymill import PaymentProcessor, gateway
+from abo.backends.paymill.checkout import get_offer_kwargs, build_backend_plan
+
+Plan = get_plan_model()
+
+logger = logging.getLogger(__name__)
+
+
+def parse_quantities(value):
+    """'1-10,20,50' -> [1, 2, ..., 10, 20, 50]"""
+    quantities = set()
+    for part in value.split(','):
+        if '-' in part:
+            start, end = part.split('-', 1)
+            quantities.update(range(int(start), int(end) + 1))
+        elif part.strip():
+            quantities.add(int(part))
+    return sorted(quantities)
+
+
+def get_lock_ttl():
+    """
+    Returns how many seconds the locks of a chunk must last: every thread makes one new_offer() call, which isn't
+    retried and times out after PAYMILL_TIMEOUT, and LOCK_TIMEOUT is left for the lookups and saving.
+    """
+    timeout = PaymentProcessor.get_backend_setting('PAYMILL_TIMEOUT', 10)
+    if isinstance(timeout, (tuple, list)):
+        timeout = sum(timeout)
+    return int(timeout) + LOCK_TIMEOUT
+
+
+class Command(BaseCommand):
+    help = 'Creates the paymill offers for the given plans and quantities that do not exist yet'
+
+    pymill_class = pymill.Pymill  # IoC for tests
+
+    option_list = BaseCommand.option_list + (
+        make_option('--plan', type='int', action='append', dest='plans', default=[],
+                    help='Id of a plan, can be given several times. Defaults to all visible plans'),
+        make_option('--quantities', dest='quantities', default='1-10',
+                    help='Quantities to create offers for, e.g. "1-50,100,200"'),
+        make_option('--concurrency', type='int', dest='concurrency', default=4,
+                    help='Number of offers created on paymill at the same time'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            quantities = parse_quantities(options['quantities'])
+        except ValueError:
+            raise CommandError('Invalid quantities: %s' % options['quantities'])
+
+        plans = Plan.objects.filter(pk__in=options['plans']) if options['plans'] else Plan.objects.filter(visible=True)
+        plans = list(plans)
+
+        existing = set(BackendPlan.objects.filter(
+            backend=PaymentProcessor.BACKEND,
+            plan__in=plans,
+            quantity__in=quantities
+        ).values_list('plan_id', 'quantity'))
+        missing = [(plan, quantity) for plan in plans for quantity in quantities if (plan.pk, quantity) not in existing]
+
+        self.stdout.write('Creating %s offers' % len(missing))
+        if not missing:
+            return
+
+        self.paymill = gateway.get_client(self.pymill_class)
+        self.offers = OfferResolver(PaymentProcessor.BACKEND)
+        concurrency = max(options['concurrency'], 1)
+        pool = ThreadPool(concurrency)
+        created = 0
+        self.skipped = []
+        try:
+            # one chunk at a time, so the locks are held for a few gateway calls only
+            for start in range(0, len(missing), concurrency):
+                created += self.provision(pool, missing[start:start + concurrency])
+        finally:
+            pool.close()
+
+        for plan, quantity in self.skipped:
+            self.stdout.write('Skipped %s x %s, a checkout is creating it' % (quantity, plan))
+        self.stdout.write('Created %s offers, %s skipped, %s failed or already created' % (
+            created, len(self.skipped), len(missing) - created - len(self.skipped)))
+
+    def provision(self, pool, chunk):
+        """
+        Creates the offers of `chunk`, a list of (plan, quantity), and returns how many were created. Every offer is
+        locked like a checkout locks it, so they never both create one. The locks are taken without waiting and last
+        longer than the chunk can take; offers that are locked by a checkout are left to it and added to `skipped`.
+        """
+        ttl = get_lock_ttl()
+        locked = []
+        try:
+            todo = []
+            for plan, quantity in chunk:
+                if not self.offers.acquire(plan, quantity, wait=False, ttl=ttl):
+                    self.skipped.append((plan, quantity))
+                    continue
+                locked.append((plan, quantity))
+                # a checkout may have created it in the meantime
+                if self.offers.get(plan, quantity) is None:
+                    todo.append((plan, quantity))
+
+            results = pool.map(self.create_offer, todo)
+            backend_plans = [build_backend_plan(offer, plan, quantity) for plan, quantity, offer in results if offer is not None]
+            self.save(backend_plans)
+            return len(backend_plans)
+        finally:
+            for plan, quantity in locked:
+                self.offers.release(plan, quantity)
+
+    def create_offer(self, plan_and_quantity):
+        plan, quantity = plan_and_quantity
+        try:
+            offer = self.paymill.new_offer(**get_offer_kwargs(plan, quantity))
+        except Exception:
+            logger.exception('Creating the offer for %s x %s failed', quantity, plan)
+            offer = None
+        return plan, quantity, offer
+
+    def save(self, backend_plans):
+        try:
+            with transaction.atomic():
+                BackendPlan.objects.bulk_create(backend_plans)
+        except IntegrityError:
+            # some were created in the meantime, e.g. by hand, fall back to one by one
+            for backend_plan in backend_plans:
+                self.offers.save(backend_plan)
@@ -0,0 +1,34 @@
+from datetime import timedelta
+from optparse import make_option
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from abo.models import PendingCheckout
+from abo.backends.paymill import PaymentProcessor
+from abo.backends.paymill.checkout import Recovery
+
+
+class Command(BaseCommand):
+    help = 'Completes or compensates paymill checkouts that did not finish'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--minutes', type='int', dest='minutes', default=15,
+                    help='Only recover checkouts without progress for this many minutes'),
+    )
+
+    def handle(self, *args, **options):
+        pending = PendingCheckout.objects.filter(
+            backend=PaymentProcessor.BACKEND,
+            state__in=('started', 'subscribing'),
+            updated_at__lt=timezone.now() - timedelta(minutes=options['minutes'])
+        ).select_related('backend_client', 'backend_plan')
+
+        recovery = Recovery()
+        states = {}
+        for checkout in pending:
+            state = recovery.recover(checkout)
+            states[state] = states.get(state, 0) + 1
+
+        for state, count in sorted(states.items()):
+            self.stdout.write('%s checkouts %s' % (count, state))
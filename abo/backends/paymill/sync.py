@@ -0,0 +1,170 @@
+"""
+Reconciles the local backend tables with Paymill, for changes whose webhook got lost.
+
+Only objects that changed on Paymill since the last run are fetched: for every
+resource the `updated_at` of the most recent change seen is remembered as a
+BackendSyncState. Every page of changed objects is compared to the local rows
+in memory and only the rows that differ are written, with one bulk update per
+page. Objects that don't exist locally are ignored.
+"""
+import time
+import logging
+from itertools import islice
+
+import pymill
+
+from abo import offers
+from abo.models import BackendClient, BackendPayment, BackendPlan, BackendSubscription, BackendSyncState
+from abo.utils import bulk_update
+
+from . import PaymentProcessor, gateway
+from .gateway import from_timestamp
+
+logger = logging.getLogger(__name__)
+
+# paymill subscription status -> BackendSubscription.status, other values leave the status alone
+SUBSCRIPTION_STATUS = {
+    'active': 'paid',
+    'failed': 'failed',
+}
+
+
+def _int(value):
+    """paymill sends some numbers as strings"""
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def _pages(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        page = list(islice(iterator, size))
+        if not page:
+            return
+        yield page
+
+
+def _apply(obj, values):
+    """Sets `values` on `obj` and returns whether any of them changed"""
+    changed = False
+    for name, value in values.items():
+        if getattr(obj, name) != value:
+            setattr(obj, name, value)
+            changed = True
+    return changed
+
+
+class Synchronizer(object):
+    """
+    `fetch(resource, since, until)` yields the paymill objects of a resource as
+    dicts, it defaults to the paymill REST API.
+    """
+    RESOURCES = ('offers', 'clients', 'payments', 'subscriptions')
+
+    def __init__(self, fetch=None, page_size=100):
+        self.backend = PaymentProcessor.BACKEND
+        self.fetch = fetch or self.fetch_from_gateway
+        self.page_size = page_size
+
+    def fetch_from_gateway(self, resource, since, until):
+        client = gateway.get_client(pymill.Pymill)
+        return gateway.iter_updated(client, resource, since, until, page_size=self.page_size)
+
+    def run(self, full=False):
+        """
+        Synchronizes all resources and returns the number of changed rows per resource.
+        With `full` every object is fetched, not only the ones changed since the last run.
+        """
+        until = int(time.time())
+        changes = {}
+        for resource in self.RESOURCES:
+            state, created = BackendSyncState.objects.get_or_create(backend=self.backend, resource=resource)
+            since = 0 if full else state.high_water_mark
+            changes[resource] = 0
+
+            for page in _pages(self.fetch(resource, since, until), self.page_size):
+                items = dict((item['id'], item) for item in page)
+                changes[resource] += len(getattr(self, 'sync_' + resource)(items))
+
+                # remembered after every page, so an interrupted run resumes where it stopped
+                state.high_water_mark = max([state.high_water_mark] + [int(item['updated_at']) for item in page])
+                state.save()
+
+            logger.info('Synchronized %s: %s changed', resource, changes[resource])
+        return changes
+
+    def sync(self, queryset, items, convert, fields):
+        """
+        Updates the rows of `queryset` that are in `items` and differ from them,
+        `convert(item, obj)` returns the field values of a paymill object.
+        """
+        changed = []
+        for obj in queryset.filter(backend=self.backend, external_id__in=list(items)):
+            item = items[obj.external_id]
+            if _apply(obj, convert(item, obj)):
+                obj.updated_at = from_timestamp(item['updated_at'])
+                changed.append(obj)
+
+        bulk_update(changed, list(fields) + ['updated_at'])
+        return changed
+
+    def sync_offers(self, items):
+        def convert(item, backend_plan):
+            count = item.get('subscription_count') or {}
+            return {
+                'subscription_count_active': _int(count.get('active')),
+                'subscription_count_inactive': _int(count.get('inactive')),
+            }
+
+        changed = self.sync(BackendPlan.objects.all(), items, convert,
+                            ['subscription_count_active', 'subscription_count_inactive'])
+        # a bulk update sends no post_save
+        for backend_plan in changed:
+            offers.invalidate(backend_plan.backend, backend_plan.plan_id, backend_plan.quantity)
+        return changed
+
+    def sync_clients(self, items):
+        def convert(item, backend_client):
+            return {
+                'email': item.get('email'),
+                'description': item.get('description'),
+            }
+
+        return self.sync(BackendClient.objects.all(), items, convert, ['email', 'description'])
+
+    def sync_payments(self, items):
+        def convert(item, backend_payment):
+            return {
+                'holder': item.get('card_holder') or item.get('holder'),  # cc --> card_holder; dd --> holder
+                'card_type': item.get('card_type'),
+                'expire_month': _int(item.get('expire_month')),
+                'expire_year': _int(item.get('expire_year')),
+                'last4': item.get('last4'),
+            }
+
+        return self.sync(BackendPayment.objects.all(), items, convert,
+                         ['holder', 'card_type', 'expire_month', 'expire_year', 'last4'])
+
+    def sync_subscriptions(self, items):
+        def convert(item, backend_subscription):
+            return {
+                'status': SUBSCRIPTION_STATUS.get(item.get('status'), backend_subscription.status),
+                'next_capture_at': from_timestamp(item.get('next_capture_at')),
+                'canceled_at': from_timestamp(item.get('canceled_at')),
+            }
+
+        changed = self.sync(BackendSubscription.objects.select_related('subscription'), items, convert,
+                            ['status', 'next_capture_at', 'canceled_at'])
+
+        canceled = []
+        for backend_subscription in changed:
+            subscription = backend_subscription.subscription
+            if backend_subscription.canceled_at is not None and not subscription.deleted:
+                subscription.deleted = True
+                canceled.append(subscription)
+        bulk_update(canceled, ['deleted'])
+
+        for obj in changed + canceled:
+            obj.send_transitions()
+        return changed
@@ -1,3 +1,4 @@
+import time
 from datetime import datetime
 import pymill
 
@@ -57,3 +58,24 @@ class MockmillFailOffer(Mockmill):
     def new_offer(*args, **kwargs):
         json_data = {'exception': 'mocked exception', 'error': 'something went wrong'}
         raise Exception(json_data)
+
+
+class SlowMockmill(Mockmill):
+    '''every call takes DELAY seconds, like a real gateway'''
+    DELAY = 0.2
+
+    def new_client(self, *args, **kwargs):
+        time.sleep(self.DELAY)
+        return super(SlowMockmill, self).new_client(*args, **kwargs)
+
+    def new_card(self, *args, **kwargs):
+        time.sleep(self.DELAY)
+        return super(SlowMockmill, self).new_card(*args, **kwargs)
+
+    def new_offer(self, *args, **kwargs):
+        time.sleep(self.DELAY)
+        return Mockmill.new_offer(self, *args, **kwargs)
+
+    def new_subscription(self, *args, **kwargs):
+        time.sleep(self.DELAY)
+        return super(SlowMockmill, self).new_subscription(*args, **kwargs)
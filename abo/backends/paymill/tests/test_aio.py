@@ -0,0 +1,72 @@
+import sys
+import unittest
+
+from abo.factories import PlanFactory
+from abo.models import BackendEvent, BackendSubscription
+from abo.tests.base import CacheResetTestCase
+from abo.backends.paymill import PaymentProcessor
+
+from .mockups import Mockmill
+
+
+class InlineExecutor(object):
+    '''runs the work in the calling thread, so it sees the transaction of the test'''
+    def submit(self, fn, *args, **kwargs):
+        from concurrent.futures import Future
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+@unittest.skipIf(sys.version_info < (3, 4), 'asyncio needs Python >= 3.4')
+class AsyncTestCase(CacheResetTestCase):
+    def setUp(self):
+        super(AsyncTestCase, self).setUp()
+        from abo import aio as abo_aio
+        self.executor, abo_aio._executor = abo_aio._executor, InlineExecutor()
+        # the connection of the test must stay open
+        self.close_old_connections, abo_aio.close_old_connections = abo_aio.close_old_connections, lambda: None
+
+    def tearDown(self):
+        from abo import aio as abo_aio
+        abo_aio._executor = self.executor
+        abo_aio.close_old_connections = self.close_old_connections
+
+    def run_until_complete(self, future):
+        import asyncio
+        return asyncio.get_event_loop().run_until_complete(future)
+
+    def test_gateway_url(self):
+        url, method, params = self.run_until_complete(PaymentProcessor.get_gateway_url_async(None))
+        self.assertEqual((url, method), PaymentProcessor.get_gateway_url(None)[:2])
+
+    def test_invalid_webhook(self):
+        from abo.backends.paymill import aio
+        self.assertEqual(self.run_until_complete(aio.handle_webhook({'event': {}})), 400)
+
+    def test_webhook(self):
+        from abo.backends.paymill import aio
+        message = {'event': {'event_type': 'subscription.succeeded', 'event_resource': {'subscription': {'id': 'subscription1'}}}}
+
+        self.assertEqual(self.run_until_complete(aio.handle_webhook(message)), 200)
+        # a retried delivery is acknowledged, but not stored again
+        self.assertEqual(self.run_until_complete(aio.handle_webhook(message)), 200)
+
+        event = BackendEvent.objects.get()
+        self.assertEqual((event.event_type, event.processed), ('subscription.succeeded', False))
+
+    def test_checkout(self):
+        from abo.backends.paymill import aio
+        plan = PlanFactory()
+
+        def on_error(exception):
+            raise exception
+
+        subscription = self.run_until_complete(aio.checkout(plan, 2, 'test@example.com', 'xxx123', on_error,
+                                                            pymill_class=Mockmill))
+
+        self.assertEqual((subscription.plan, subscription.quantity), (plan, 2))
+        self.assertEqual(BackendSubscription.objects.get().subscription, subscription)
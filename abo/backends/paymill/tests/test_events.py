@@ -1,16 +1,23 @@
 import json
 
-from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.core.urlresolvers import reverse
+from django.core.management import call_command
+from django.contrib.contenttypes.models import ContentType
 
+from abo.entitlements import get_entitlement
 from abo.factories import PlanFactory
 from abo.backends.paymill.forms import PaymillForm
-from abo.models import BackendSubscription
+from abo.models import BackendSubscription, BackendEvent
+
+from abo.backends.paymill.events import EventProcessor
+from abo.tests.base import CacheResetTestCase
 
 from .mockups import Mockmill
 
 
-class EventTestCase(TestCase):
+class EventTestCase(CacheResetTestCase):
     def _create_subscription(self):
         self.plan = PlanFactory()
         self.formdata = {
@@ -24,6 +31,7 @@ class EventTestCase(TestCase):
         form.full_clean()
 
     def setUp(self):
+        super(EventTestCase, self).setUp()
         self._create_subscription()
         self.secret = "0" * 32
         self.webhook_url = reverse('abo-paymill-webhook', args=[self.secret, ])
@@ -32,6 +40,7 @@ class EventTestCase(TestCase):
         msg = {u'event': {u'event_resource': {u'transaction': {u'status': u'closed', u'created_at': 1393435183, u'description': u'Subscription#subscription1 Almost Free Extended 50% off, Quantity: 3', u'refunds': None, u'invoices': [], u'response_code': 20000, u'livemode': False, u'origin_amount': 110094, u'updated_at': 1393435184, u'preauthorization': None, u'app_id': None, u'currency': u'EUR', u'amount': u'110094', u'short_id': u'7357.7357.7357', u'client': {u'description': None, u'payment': [u'payment1'], u'created_at': 1393435182, u'updated_at': 1393435182, u'app_id': None, u'id': u'client1', u'email': u'admin@chatgrape.com', u'subscription': None}, u'fees': [], u'id': u'transaction1', u'is_fraud': False, u'payment': {u'expire_month': u'11', u'country': None, u'created_at': 1393435181, u'app_id': None, u'updated_at': 1393435183, u'card_type': u'mastercard', u'last4': u'0004', u'client': u'client1', u'type': u'creditcard', u'expire_year': u'2020', u'card_holder': u'l\xf6kasdf', u'id': u'payment1'}}, u'subscription': {u'trial_start': None, u'cancel_at_period_end': False, u'offer': {u'subscription_count': {u'active': u'1', u'inactive': 0}, u'name': u'Almost Free Extended 50% off, Quantity: 3', u'created_at': 1393435183, u'interval': u'3 YEAR', u'app_id': None, u'updated_at': 1393435183, u'currency': u'EUR', u'amount': 110094, u'trial_period_days': 0, u'id': u'offer1'}, u'canceled_at': None, u'created_at': 1393435183, u'livemode': False, u'updated_at': 1393435184, u'app_id': None, u'trial_end': None, u'client': {u'description': None, u'payment': [{u'expire_month': u'11', u'country': None, u'created_at': 1393435181, u'app_id': None, u'updated_at': 1393435183, u'card_type': u'mastercard', u'last4': u'0004', u'client': u'client1', u'type': u'creditcard', u'expire_year': u'2020', u'card_holder': u'l\xf6kasdf', u'id': u'payment1'}], u'created_at': 1393435182, u'updated_at': 1393435182, u'app_id': None, u'id': u'client1', u'email': u'admin@chatgrape.com', u'subscription': None}, u'next_capture_at': 1488129584, u'id': u'subscription1', u'payment': {u'expire_month': u'11', u'country': None, u'created_at': 1393435181, u'app_id': None, u'updated_at': 1393435183, u'card_type': u'mastercard', u'last4': u'0004', u'client': u'client1', u'type': u'creditcard', u'expire_year': u'2020', u'card_holder': u'l\xf6kasdf', u'id': u'payment1'}}}, u'created_at': 1393435184, u'event_type': u'subscription.succeeded', u'app_id': None}}
 
         self.client.post(self.webhook_url, json.dumps(msg), content_type="application/json")
+        call_command('process_events', concurrency=1)
 
         bs = BackendSubscription.objects.get(external_id='subscription1')
         self.assertEqual(bs.status, 'paid')
@@ -40,6 +49,61 @@ class EventTestCase(TestCase):
         msg = {u'event': {u'event_resource': {u'transaction': {u'status': u'failed', u'created_at': 1393529473, u'description': u'Subscription#subscription1 Product Extended 50% off, Quantity: 5', u'refunds': None, u'invoices': [], u'response_code': 40103, u'livemode': False, u'origin_amount': 16905, u'updated_at': 1393529473, u'preauthorization': None, u'app_id': None, u'currency': u'EUR', u'amount': u'16905', u'short_id': None, u'client': {u'description': None, u'payment': [u'payment1'], u'created_at': 1393529473, u'updated_at': 1393529473, u'app_id': None, u'id': u'client1', u'email': u'admin@chatgrape.com', u'subscription': None}, u'fees': [], u'id': u'transaction1', u'is_fraud': False, u'payment': {u'expire_month': u'4', u'country': None, u'created_at': 1393529472, u'app_id': None, u'updated_at': 1393529473, u'card_type': u'mastercard', u'last4': u'5100', u'client': u'client1', u'type': u'creditcard', u'expire_year': u'2020', u'card_holder': u'lol rofl', u'id': u'payment1'}}, u'subscription': {u'trial_start': None, u'cancel_at_period_end': False, u'offer': {u'subscription_count': {u'active': u'2', u'inactive': 0}, u'name': u'Product Extended 50% off, Quantity: 5', u'created_at': 1393529369, u'interval': u'2 YEAR', u'app_id': None, u'updated_at': 1393529369, u'currency': u'EUR', u'amount': 16905, u'trial_period_days': 0, u'id': u'offer_f056f0ad034952fd8992'}, u'canceled_at': None, u'created_at': 1393529473, u'livemode': False, u'updated_at': 1393529473, u'app_id': None, u'trial_end': None, u'client': {u'description': None, u'payment': [{u'expire_month': u'4', u'country': None, u'created_at': 1393529472, u'app_id': None, u'updated_at': 1393529473, u'card_type': u'mastercard', u'last4': u'5100', u'client': u'client1', u'type': u'creditcard', u'expire_year': u'2020', u'card_holder': u'lol rofl', u'id': u'payment1'}], u'created_at': 1393529473, u'updated_at': 1393529473, u'app_id': None, u'id': u'client1', u'email': u'admin@chatgrape.com', u'subscription': None}, u'next_capture_at': 1456601473, u'id': u'subscription1', u'payment': {u'expire_month': u'4', u'country': None, u'created_at': 1393529472, u'app_id': None, u'updated_at': 1393529473, u'card_type': u'mastercard', u'last4': u'5100', u'client': u'client1', u'type': u'creditcard', u'expire_year': u'2020', u'card_holder': u'lol rofl', u'id': u'payment1'}}}, u'created_at': 1393529473, u'event_type': u'subscription.failed', u'app_id': None}}
 
         self.client.post(self.webhook_url, json.dumps(msg), content_type="application/json")
+        call_command('process_events', concurrency=1)
 
         bs = BackendSubscription.objects.get(external_id='subscription1')
         self.assertEqual(bs.status, 'failed')
+
+    def test_webhook_only_queues_event(self):
+        msg = {u'event': {u'event_resource': {u'subscription': {u'id': u'subscription1'}}, u'event_type': u'subscription.succeeded'}}
+
+        response = self.client.post(self.webhook_url, json.dumps(msg), content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(BackendEvent.objects.get().processed)
+        self.assertEqual(BackendSubscription.objects.get(external_id='subscription1').status, 'new')
+
+        call_command('process_events', concurrency=1)
+
+        self.assertTrue(BackendEvent.objects.get().processed)
+        self.assertEqual(BackendSubscription.objects.get(external_id='subscription1').status, 'paid')
+
+    def test_retried_delivery_is_ignored(self):
+        msg = {u'event': {u'event_resource': {u'subscription': {u'id': u'subscription1'}}, u'event_type': u'subscription.succeeded'}}
+
+        self.client.post(self.webhook_url, json.dumps(msg), content_type="application/json")
+        response = self.client.post(self.webhook_url, json.dumps(msg, indent=2), content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(BackendEvent.objects.count(), 1)
+
+    def test_batch_processing_queries(self):
+        backend_subscription = BackendSubscription.objects.get(external_id='subscription1')
+        # the entitlement of the subscriber is updated on every status transition
+        subscription = backend_subscription.subscription
+        subscription.subscriber = self.plan
+        subscription.save()
+        ContentType.objects.get_for_model(BackendSubscription)  # warm up the content type cache
+
+        msg = {u'event': {u'event_resource': {u'subscription': {u'id': u'subscription1'}}, u'event_type': u'subscription.succeeded'}}
+
+        def process(count, offset):
+            BackendSubscription.objects.filter(pk=backend_subscription.pk).update(status='new')
+            events = [
+                BackendEvent.objects.create(
+                    backend='abo.backends.paymill',
+                    external_id=str(offset + i),
+                    event_type=u'subscription.succeeded',
+                    message=msg
+                ) for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(EventProcessor.process_batch(events), [])
+            return len(queries)
+
+        # the number of queries depends on the changed subscriptions, not on the number of events
+        self.assertEqual(process(5, 0), process(40, 100))
+
+        self.assertEqual(BackendEvent.objects.filter(processed=False).count(), 0)
+        self.assertEqual(BackendSubscription.objects.get(external_id='subscription1').status, 'paid')
+        self.assertEqual(get_entitlement(self.plan).status, 'paid')
@@ -1,17 +1,24 @@
-from django.test import TestCase
+import time
 
 from abo.factories import PlanFactory
 from abo.backends.paymill.forms import PaymillForm
-from abo.models import BackendPayment, BackendPlan, BackendSubscription
+from abo.backends.paymill.checkout import Checkout, Recovery
+from abo.signals import checkout_step, payment_error
+from abo.circuit import CircuitBreaker
+from abo.backends.paymill import PaymentProcessor
+from abo import offers
+from abo.models import BackendPayment, BackendPlan, BackendSubscription, BackendClient, PendingCheckout
 from abo import get_subscription_model
+from abo.tests.base import CacheResetTestCase
 
-from .mockups import Mockmill, MockmillFailOffer
+from .mockups import Mockmill, MockmillFailOffer, SlowMockmill
 
 Subscription = get_subscription_model()
 
 
-class FormHandlingTestCase(TestCase):
+class FormHandlingTestCase(CacheResetTestCase):
     def setUp(self):
+        super(FormHandlingTestCase, self).setUp()
         self.plan = PlanFactory()
         self.formdata = {
             'token': 'xxx123',
@@ -47,3 +54,127 @@ class FormHandlingTestCase(TestCase):
 
         self.assertEquals(form.subscription, BackendSubscription.objects.get(external_id="subscription1").subscription)
         self.assertEquals(form.subscription.plan, BackendPlan.objects.get(external_id="offer1").plan)
+
+    def test_checkout_progress_is_recorded(self):
+        form = PaymillForm(data=self.formdata)
+        form.set_pymill(MockmillFailOffer)
+        form.full_clean()
+
+        pending = PendingCheckout.objects.get()
+        self.assertEquals(pending.state, 'failed')
+        self.assertEquals(pending.error_code, 'mocked exception')
+        self.assertEquals(pending.backend_payment.external_id, 'payment1')
+
+    def test_recover_interrupted_checkout(self):
+        form = PaymillForm(data=self.formdata)
+        form.set_pymill(Mockmill)
+        form.full_clean()
+        # as if the process died during the call to paymill
+        PendingCheckout.objects.update(state='subscribing', backend_subscription=None)
+        BackendSubscription.objects.all().delete()
+        pending = PendingCheckout.objects.get()
+
+        found = [{'id': 'subscription1', 'offer': {'id': 'offer1'}, 'created_at': 1393435183, 'updated_at': 1393435184}]
+        self.assertEquals(Recovery(find_subscriptions=lambda client_id: found).recover(pending), 'completed')
+        self.assertEquals(BackendSubscription.objects.get().subscription, form.subscription)
+
+        pending.state = 'subscribing'
+        pending.backend_subscription = None
+        pending.save()
+        BackendSubscription.objects.all().delete()
+        self.assertEquals(Recovery(find_subscriptions=lambda client_id: []).recover(pending), 'compensated')
+        self.assertTrue(Subscription.objects.get().deleted)
+
+    def test_checkout_records_survive_deletions(self):
+        form = PaymillForm(data=self.formdata)
+        form.set_pymill(Mockmill)
+        form.full_clean()
+
+        BackendPayment.objects.all().delete()
+        BackendClient.objects.all().delete()
+        Subscription.objects.all().delete()
+
+        pending = PendingCheckout.objects.get()
+        self.assertEquals(pending.state, 'completed')
+        self.assertEquals((pending.backend_payment, pending.backend_client, pending.subscription), (None, None, None))
+
+    def test_open_circuit_fails_fast(self):
+        CircuitBreaker(PaymentProcessor.BACKEND, threshold=1).failure()
+        error_codes = []
+
+        def receiver(sender, error_code, **kwargs):
+            error_codes.append(error_code)
+        payment_error.connect(receiver)
+        try:
+            form = PaymillForm(data=self.formdata)
+            form.set_pymill(Mockmill)
+            form.full_clean()
+        finally:
+            payment_error.disconnect(receiver)
+
+        self.assertEquals(error_codes, ['circuit_open'])
+        self.assertEquals(BackendClient.objects.count(), 0)
+
+    def test_offer_locked_by_another_checkout(self):
+        offers.OfferResolver(PaymentProcessor.BACKEND).acquire(self.plan, 1)
+        error_codes = []
+
+        def receiver(sender, error_code, **kwargs):
+            error_codes.append(error_code)
+        payment_error.connect(receiver)
+        timeout, offers.LOCK_TIMEOUT = offers.LOCK_TIMEOUT, 0
+        try:
+            form = PaymillForm(data=self.formdata)
+            form.set_pymill(Mockmill)
+            form.full_clean()
+        finally:
+            offers.LOCK_TIMEOUT = timeout
+            payment_error.disconnect(receiver)
+
+        # no second offer is created without the lock, the customer can try again
+        self.assertEquals(error_codes, ['offer_locked'])
+        self.assertEquals(BackendPlan.objects.count(), 0)
+        self.assertEquals(Subscription.objects.count(), 0)
+
+    def test_checkout_steps_are_timed(self):
+        steps = []
+
+        def receiver(sender, step, outcome, error_code, **kwargs):
+            steps.append((step, outcome, error_code))
+        checkout_step.connect(receiver)
+        try:
+            form = PaymillForm(data=self.formdata)
+            form.set_pymill(MockmillFailOffer)
+            form.full_clean()
+        finally:
+            checkout_step.disconnect(receiver)
+
+        self.assertEquals(sorted(steps), [('card', 'success', None), ('client', 'success', None), ('offer', 'error', 'mocked exception')])
+
+
+class CheckoutLatencyTestCase(CacheResetTestCase):
+    def setUp(self):
+        super(CheckoutLatencyTestCase, self).setUp()
+        self.plan = PlanFactory()
+
+    def on_error(self, exception):
+        raise exception
+
+    def checkout(self, concurrent):
+        checkout = Checkout(SlowMockmill(), on_error=self.on_error, concurrent=concurrent)
+        start = time.time()
+        checkout.run(self.plan, 1, 'test@example.com', 'xxx123')
+        duration = time.time() - start
+
+        # the next checkout has to create everything again
+        BackendClient.objects.all().delete()
+        BackendPlan.objects.all().delete()
+        return duration
+
+    def test_concurrent_checkout_is_faster(self):
+        sequential = self.checkout(concurrent=False)
+        concurrent = self.checkout(concurrent=True)
+
+        # sequential: client + card + offer + subscription, concurrent: client + card + subscription
+        self.assertGreaterEqual(sequential, 4 * SlowMockmill.DELAY)
+        self.assertLess(concurrent, sequential - SlowMockmill.DELAY / 2)
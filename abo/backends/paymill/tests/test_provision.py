@@ -0,0 +1,101 @@
+import threading
+from multiprocessing.pool import ThreadPool
+
+import pymill
+from django.core.management import call_command
+from django.utils.six import StringIO
+
+from abo.factories import PlanFactory
+from abo.models import BackendPlan
+from abo.offers import OfferResolver
+from abo.tests.base import CacheResetTestCase
+from abo.backends.paymill import PaymentProcessor
+from abo.backends.paymill.management.commands.provision_offers import Command, parse_quantities
+
+from .mockups import Mockmill
+
+
+class OfferMockmill(Mockmill):
+    '''creates offers with distinct ids and remembers them'''
+    created = []
+    lock = threading.Lock()
+
+    def new_offer(self, name, **kwargs):
+        with self.lock:
+            self.created.append(name)
+            return pymill.Offer(id='offer%s' % len(self.created), name=name)
+
+
+class ProvisionOffersTestCase(CacheResetTestCase):
+    def setUp(self):
+        super(ProvisionOffersTestCase, self).setUp()
+        self.plan = PlanFactory()
+        OfferMockmill.created = []
+        self.pymill_class = Command.pymill_class
+        Command.pymill_class = OfferMockmill
+
+    def tearDown(self):
+        Command.pymill_class = self.pymill_class
+
+    def create_backend_plan(self, external_id, quantity):
+        return BackendPlan.objects.create(backend=PaymentProcessor.BACKEND, external_id=external_id, plan=self.plan,
+                                          quantity=quantity)
+
+    def test_parse_quantities(self):
+        self.assertEqual(parse_quantities('1-3,5, 7,'), [1, 2, 3, 5, 7])
+        self.assertRaises(ValueError, parse_quantities, '1-x')
+
+    def test_creates_missing_offers(self):
+        self.create_backend_plan('existing', 2)
+
+        call_command('provision_offers', plans=[self.plan.pk], quantities='1-5', concurrency=2, stdout=StringIO())
+
+        self.assertEqual(len(OfferMockmill.created), 4)
+        self.assertEqual(
+            sorted(BackendPlan.objects.filter(plan=self.plan).values_list('quantity', flat=True)),
+            [1, 2, 3, 4, 5]
+        )
+
+    def test_skips_offers_created_by_a_checkout(self):
+        self.create_backend_plan('checkout', 1)
+        command = Command()
+        command.paymill = OfferMockmill()
+        command.offers = OfferResolver(PaymentProcessor.BACKEND)
+        command.skipped = []
+
+        pool = ThreadPool(1)
+        try:
+            self.assertEqual(command.provision(pool, [(self.plan, 1)]), 0)
+        finally:
+            pool.close()
+
+        self.assertEqual(OfferMockmill.created, [])
+        self.assertEqual(command.skipped, [])
+        # the lock was released
+        self.assertTrue(command.offers.acquire(self.plan, 1))
+
+    def test_skips_offers_locked_by_a_checkout(self):
+        checkout_offers = OfferResolver(PaymentProcessor.BACKEND)
+        self.assertTrue(checkout_offers.acquire(self.plan, 1))
+
+        stdout = StringIO()
+        call_command('provision_offers', plans=[self.plan.pk], quantities='1-2', concurrency=2, stdout=stdout)
+
+        # left to the checkout, the lock still belongs to it
+        self.assertEqual(len(OfferMockmill.created), 1)
+        self.assertEqual(list(BackendPlan.objects.filter(plan=self.plan).values_list('quantity', flat=True)), [2])
+        self.assertIn('Skipped 1 x', stdout.getvalue())
+        self.assertFalse(checkout_offers.acquire(self.plan, 1, wait=False))
+
+    def test_save_falls_back_to_one_by_one(self):
+        existing = self.create_backend_plan('existing', 1)
+        command = Command()
+        command.offers = OfferResolver(PaymentProcessor.BACKEND)
+
+        command.save([
+            BackendPlan(backend=PaymentProcessor.BACKEND, external_id='new1', plan=self.plan, quantity=1),
+            BackendPlan(backend=PaymentProcessor.BACKEND, external_id='new2', plan=self.plan, quantity=2),
+        ])
+
+        self.assertEqual(BackendPlan.objects.get(plan=self.plan, quantity=1).pk, existing.pk)
+        self.assertEqual(BackendPlan.objects.get(plan=self.plan, quantity=2).external_id, 'new2')
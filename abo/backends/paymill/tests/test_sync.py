@@ -0,0 +1,59 @@
+from abo.factories import PlanFactory
+from abo.backends.paymill.forms import PaymillForm
+from abo.backends.paymill.sync import Synchronizer
+from abo.models import BackendSubscription, BackendPlan, BackendSyncState
+from abo.tests.base import CacheResetTestCase
+
+from .mockups import Mockmill
+
+
+class FakeGateway(object):
+    def __init__(self, **resources):
+        self.resources = resources
+        self.calls = []
+
+    def __call__(self, resource, since, until):
+        self.calls.append((resource, since))
+        return [item for item in self.resources.get(resource, []) if item['updated_at'] >= since]
+
+
+class SyncTestCase(CacheResetTestCase):
+    def setUp(self):
+        super(SyncTestCase, self).setUp()
+        self.plan = PlanFactory()
+        form = PaymillForm(data={
+            'token': 'xxx123',
+            'plan': self.plan.id,
+            'quantity': 1,
+            'email': 'test@example.com'
+        })
+        form.set_pymill(Mockmill)
+        form.full_clean()
+
+    def test_changes_are_applied(self):
+        fetch = FakeGateway(
+            subscriptions=[{'id': 'subscription1', 'status': 'failed', 'next_capture_at': 1456601473,
+                            'canceled_at': None, 'updated_at': 1400000000}],
+            offers=[{'id': 'offer1', 'subscription_count': {'active': '3', 'inactive': 1}, 'updated_at': 1400000001}],
+        )
+
+        changes = Synchronizer(fetch=fetch).run()
+
+        self.assertEqual(changes['subscriptions'], 1)
+        self.assertEqual(BackendSubscription.objects.get(external_id='subscription1').status, 'failed')
+        self.assertEqual(BackendPlan.objects.get(external_id='offer1').subscription_count_active, 3)
+        self.assertEqual(BackendSyncState.objects.get(resource='offers').high_water_mark, 1400000001)
+
+    def test_only_changes_since_last_run_are_fetched(self):
+        fetch = FakeGateway(
+            subscriptions=[{'id': 'subscription1', 'status': 'failed', 'next_capture_at': None,
+                            'canceled_at': 1400000000, 'updated_at': 1400000000}],
+        )
+        Synchronizer(fetch=fetch).run()
+        fetch.calls = []
+
+        changes = Synchronizer(fetch=fetch).run()
+
+        self.assertIn(('subscriptions', 1400000000), fetch.calls)
+        self.assertEqual(changes['subscriptions'], 0)
+        self.assertTrue(BackendSubscription.objects.get(external_id='subscription1').subscription.deleted)
@@ -1,19 +1,19 @@
 import requests
 import json
 
-from django.test import TestCase
 from django.core.urlresolvers import reverse
 from django.contrib.auth import get_user_model
 
 from abo.factories import PlanFactory
 from abo.models import BackendSubscription
 from abo import get_subscription_model
+from abo.tests.base import CacheResetTestCase
 
 Subscription = get_subscription_model()
 User = get_user_model()
 
 
-class IntegrationTestcase(TestCase):
+class IntegrationTestcase(CacheResetTestCase):
     '''
     This tests the url config and the view (not only the form) using
     the real paymill testing backend.
@@ -21,6 +21,7 @@ class IntegrationTestcase(TestCase):
     '''
 
     def setUp(self):
+        super(IntegrationTestcase, self).setUp()
         self.plan = PlanFactory()
         self.user = User.objects.create_user('test', 'test@example.com', 'testpassword')
         self.client.login(username='test', password='testpassword')
@@ -1,9 +1,9 @@
 import json
-import uuid
 import logging
 
 from django.http import HttpResponse, HttpResponseBadRequest
 from django.core.urlresolvers import reverse
+from django.db import transaction
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.views.generic import FormView
@@ -16,6 +16,10 @@ from abo.models import BackendEvent
 logger = logging.getLogger(__name__)
 
 
+def is_valid_message(message):
+    return bool(type(message) == dict and message.get("event") and type(message["event"]) == dict and message["event"].get("event_type"))
+
+
 @csrf_exempt
 @require_POST
 def webhook(request, secret):
@@ -32,18 +36,19 @@ def webhook(request, secret):
 
     logger.debug(message)
 
-    if type(message) != dict or not message.get("event") or type(message["event"]) != dict or not message["event"].get("event_type"):
+    if not is_valid_message(message):
         logger.warning("no event_type in message")
         return HttpResponseBadRequest()
 
-    backend_event = BackendEvent.objects.create(
-        backend=backend,
-        external_id=str(uuid.uuid4()),  # paymill provides no id for events
-        event_type=message["event"]["event_type"],
-        livemode=livemode,
-        message=message
-    )
-    backend_event.process()
+    # paymill provides no id for events, retried deliveries are recognized by their payload
+    backend_event = BackendEvent.objects.queue(backend, message, message["event"]["event_type"], livemode=livemode)
+    if backend_event is None:
+        logger.info('Ignoring duplicate event')
+        return HttpResponse()
+
+    # events are processed later by the process_events management command,
+    # so the gateway gets its answer without waiting for the processor
+    logger.debug('Event %s queued', backend_event.pk)
 
     # always return an empty page, HTTP 200
     return HttpResponse()
@@ -54,6 +59,11 @@ class PaymillView(FormView):
     template_name = "paymill.html"
     backend = 'abo.backends.paymill'
 
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # the checkout must not hold a transaction open during its gateway calls, even with ATOMIC_REQUESTS
+        return transaction.non_atomic_requests(super(PaymillView, cls).as_view(**initkwargs))
+
     def get_context_data(self, **kwargs):
         context = super(PaymillView, self).get_context_data(**kwargs)
         context['PAYMILL_PUBLIC_KEY'] = PaymentProcessor.get_backend_setting('PAYMILL_PUBLIC_KEY')
@@ -2,11 +2,11 @@ import uuid
 import logging
 import pymill
 
-from urlparse import urlparse
+from django.utils.six.moves.urllib.parse import urlparse
 from django.core.urlresolvers import reverse, resolve
 from django.core.exceptions import ImproperlyConfigured
 
-from . import PaymentProcessor
+from . import PaymentProcessor, gateway
 
 logger = logging.getLogger(__name__)
 
@@ -49,7 +49,7 @@ class Webhook(object):
         if self.secret:
             return self.secret
 
-        paymill = self.Pymill(PaymentProcessor.get_backend_setting('PAYMILL_PRIVATE_KEY'))
+        paymill = gateway.get_client(self.Pymill)
         webhooks = paymill.get_webhooks()
         host = urlparse(self.host)
         for hook in webhooks:
@@ -65,7 +65,7 @@ class Webhook(object):
         return self.secret
 
     def install_webhook(self):
-        paymill = self.Pymill(PaymentProcessor.get_backend_setting('PAYMILL_PRIVATE_KEY'))
+        paymill = gateway.get_client(self.Pymill)
         if not self.host:
             raise ImproperlyConfigured('You need to set PAYMILL_WEBHOOK_HOST in your backend settings for paymill')
         secret = uuid.uuid4().hex
@@ -0,0 +1,146 @@
+"""
+The plans, served from memory instead of querying them on every page.
+
+Every process keeps the plans as a tuple together with the version of the
+catalog it loaded them for. The current version lives in the shared cache
+(ABO_CACHE) and is bumped once a transaction that saved or deleted a Plan
+is committed, so a lookup costs a single cache get and every process
+reloads after a change:
+
+    for plan in catalog.get_plans():  # the visible plans
+        ...
+    plan = catalog.get_plan(plan_id)
+
+The plans are shared by all threads of a process, don't change them.
+"""
+import copy
+import time
+import threading
+
+from django import forms
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import settings, get_plan_model
+from .utils import get_cache, on_commit
+
+Plan = get_plan_model()
+
+VERSION_KEY = 'abo:catalog:version'
+
+# version -> (plans, plans by pk)
+_local = {}
+_lock = threading.Lock()
+
+
+def get_plans_key(version):
+    return 'abo:catalog:plans:%s' % version
+
+
+def get_version():
+    """Returns the current version of the catalog, starting a new one if the cache lost it"""
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # a new start value, so no process mistakes its old plans for current ones
+        cache.add(VERSION_KEY, int(time.time() * 1000), settings.ABO_CATALOG_CACHE_TIMEOUT)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump():
+    """Starts a new version of the catalog, every process reloads the plans on its next lookup"""
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time() * 1000), settings.ABO_CATALOG_CACHE_TIMEOUT)
+    _local.clear()
+
+
+def load(version):
+    cache = get_cache()
+    plans = cache.get(get_plans_key(version))
+    if plans is None:
+        plans = tuple(Plan.objects.order_by('pk'))
+        cache.set(get_plans_key(version), plans, settings.ABO_CATALOG_CACHE_TIMEOUT)
+    return plans, dict((plan.pk, plan) for plan in plans)
+
+
+def get_catalog():
+    version = get_version()
+    try:
+        return _local[version]
+    except KeyError:
+        pass
+    with _lock:
+        if version not in _local:
+            catalog = load(version)
+            _local.clear()
+            _local[version] = catalog
+        return _local[version]
+
+
+def get_plans(hidden=False):
+    """Returns the visible plans, ordered by pk. With `hidden` the plans that are not visible are included."""
+    plans, by_pk = get_catalog()
+    return plans if hidden else tuple(plan for plan in plans if plan.visible)
+
+
+def get_plan(pk):
+    """Returns the plan with `pk`, visible or not, or None"""
+    plans, by_pk = get_catalog()
+    return by_pk.get(pk)
+
+
+def reset():
+    """Empties the in-process catalog, e.g. for tests"""
+    _local.clear()
+
+
+class PlanChoiceIterator(object):
+    """Like ModelChoiceIterator, looks the plans up when the choices are iterated, not when the field is created"""
+    def __init__(self, field):
+        self.field = field
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield (u"", self.field.empty_label)
+        for plan in get_plans():
+            yield (plan.pk, self.field.label_from_instance(plan))
+
+    def __len__(self):
+        return len(get_plans()) + (1 if self.field.empty_label is not None else 0)
+
+
+class PlanChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField of the visible plans that renders its choices and validates from the catalog.
+    The cleaned value is a copy of the plan.
+    """
+    def __init__(self, *args, **kwargs):
+        super(PlanChoiceField, self).__init__(Plan.objects.filter(visible=True), *args, **kwargs)
+
+    def _get_choices(self):
+        if hasattr(self, '_choices'):
+            return self._choices
+        return PlanChoiceIterator(self)
+
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            plan = get_plan(int(value))
+        except (ValueError, TypeError):
+            plan = None
+        if plan is None or not plan.visible:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return copy.copy(plan)
+
+
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+def plan_changed(sender, instance, **kwargs):
+    on_commit(bump)
@@ -13,6 +13,14 @@ SUBSCRIPTION_STATUS_CHOICES = (
     ('failed', _('failed')),
 )
 
+CHECKOUT_STATE_CHOICES = (
+    ('started', _('started')),
+    ('subscribing', _('subscribing')),
+    ('completed', _('completed')),
+    ('failed', _('failed')),
+    ('compensated', _('compensated')),
+)
+
 TRANSACTION_STATUS_CHOICES = (
     ('open', _('open')),
     ('pending', _('pending')),
@@ -0,0 +1,129 @@
+"""
+Retries and a circuit breaker for the calls to the payment gateways.
+
+When a gateway is down or slow, every checkout would wait for its timeout.
+The circuit breaker of a backend opens after `threshold` transient failures
+(connection errors, timeouts, server errors) and fails all calls immediately
+with CircuitOpen for `reset_timeout` seconds. Its state is kept in ABO_CACHE,
+so it is shared by all processes. After that calls go through again, but the
+first transient failure opens it again; a successful call closes it.
+
+CircuitOpen carries the error code 'circuit_open' in the format of pymill's
+exceptions, so the checkout reports it through the payment_error signal like
+any other gateway error.
+
+Idempotent calls (`get_*`) are retried on transient failures with jittered
+exponential backoff.
+"""
+import time
+import random
+import logging
+
+from requests import RequestException
+
+from . import tracing
+from .utils import get_cache
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name):
+        super(CircuitOpen, self).__init__({
+            'exception': 'circuit_open',
+            'error': 'The payment gateway %s is not available' % name
+        })
+
+
+def is_transient(exception):
+    """
+    Connection problems, timeouts and server errors are transient, a declined card is not. The status is the one of
+    the last response of the failed call, GuardedClient resets it before every call.
+    """
+    if isinstance(exception, RequestException):
+        return True
+    status = tracing.get_last_status()
+    return status is not None and status >= 500
+
+
+class CircuitBreaker(object):
+    def __init__(self, name, threshold=5, reset_timeout=30, window=60):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.window = window
+        self.cache = get_cache()
+        self.open_key = 'abo:circuit:%s:open' % name
+        self.failures_key = 'abo:circuit:%s:failures' % name
+
+    def before_call(self):
+        """Raises CircuitOpen if the circuit is open, otherwise returns the number of recent failures"""
+        values = self.cache.get_many([self.open_key, self.failures_key])
+        if values.get(self.open_key):
+            raise CircuitOpen(self.name)
+        return values.get(self.failures_key, 0)
+
+    def success(self, failures):
+        if failures:
+            self.cache.delete(self.failures_key)
+
+    def failure(self):
+        self.cache.add(self.failures_key, 0, self.window)
+        try:
+            failures = self.cache.incr(self.failures_key)
+        except ValueError:
+            # expired in the meantime
+            failures = 1
+
+        if failures >= self.threshold:
+            logger.warning('Opening the circuit of %s for %s seconds after %s failures', self.name, self.reset_timeout, failures)
+            self.cache.set(self.open_key, True, self.reset_timeout)
+            # after the reset timeout the next failure opens the circuit again
+            self.cache.set(self.failures_key, self.threshold - 1, self.reset_timeout + self.window)
+
+
+class GuardedClient(object):
+    """
+    Proxy for a gateway client that guards the calls of its public methods
+    with `breaker` and retries idempotent ones up to `retries` times.
+    """
+    def __init__(self, client, breaker, retries=2, backoff=0.1):
+        self._client = client
+        self._breaker = breaker
+        self._retries = retries
+        self._backoff = backoff
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def guarded(*args, **kwargs):
+            return self._call(name, attr, args, kwargs)
+        guarded.__name__ = name
+        return guarded
+
+    def _call(self, name, fn, args, kwargs):
+        retries = self._retries if name.startswith('get_') else 0
+        attempt = 0
+        while True:
+            failures = self._breaker.before_call()
+            # the status of an earlier call must not classify this one
+            tracing.reset()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    # the gateway answered, e.g. a declined card
+                    self._breaker.success(failures)
+                    raise
+                self._breaker.failure()
+                if attempt >= retries:
+                    raise
+                delay = random.uniform(0, self._backoff * 2 ** attempt)
+                logger.info('%s failed (%r), retrying in %.2f seconds', name, e, delay)
+                time.sleep(delay)
+                attempt += 1
+            else:
+                self._breaker.success(failures)
+                return result
@@ -0,0 +1,37 @@
+from functools import wraps
+
+from django.core.urlresolvers import reverse
+from django.shortcuts import redirect
+from django.utils.decorators import available_attrs
+
+from .middleware import get_request_entitlement
+
+
+def subscription_required(view_func=None, plan=None, redirect_url=None):
+    """
+    Decorator for views that only subscribers with an active subscription may see. With `plan` (a plan, a pk or a
+    list of them) the subscription has to be for one of these plans. Everyone else is redirected to `redirect_url`,
+    the subscribe view by default.
+
+        @subscription_required(plan=premium)
+        def view(request):
+            ...
+    """
+    if plan is None:
+        plan_ids = None
+    else:
+        plans = plan if isinstance(plan, (list, tuple, set)) else [plan]
+        plan_ids = set(getattr(p, 'pk', p) for p in plans)
+
+    def decorator(func):
+        @wraps(func, assigned=available_attrs(func))
+        def wrapped_view(request, *args, **kwargs):
+            entitlement = get_request_entitlement(request)
+            if entitlement.active and (plan_ids is None or entitlement.plan_id in plan_ids):
+                return func(request, *args, **kwargs)
+            return redirect(redirect_url or reverse('abo-subscribe'))
+        return wrapped_view
+
+    if view_func is not None:
+        return decorator(view_func)
+    return decorator
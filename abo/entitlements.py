@@ -0,0 +1,156 @@
+"""
+Answers "is this customer subscribed?" without joining subscriptions and backend subscriptions.
+
+The state of the current subscription of every subscriber is kept in the
+Entitlement table and in the shared cache (ABO_CACHE). The table is updated
+eagerly whenever a subscription is saved, created in bulk or canceled or the
+status of a backend subscription changes, e.g. by an event; the cached state
+is dropped once that transaction is committed, so a lookup costs no query
+once the cache is warm again:
+
+    entitlement = get_entitlement(request.user)
+    if entitlement is not None and entitlement.active:
+        ...
+
+Subscription.objects.bulk_create() on databases that don't return the pks
+skips the update, call update_entitlement() with the saved subscriptions.
+Subscription.objects.reprice() only changes totals, which entitlements don't
+store.
+"""
+from collections import namedtuple
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction, IntegrityError
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import settings, get_subscription_model
+from .models import BackendSubscription, Entitlement
+from .signals import new_subscriptions, subscription_canceled, subscription_status_changed
+from .utils import get_cache, on_commit
+
+Subscription = get_subscription_model()
+
+# status of the backend subscription -> subscriber is entitled, a checkout that is not paid yet counts
+ACTIVE_STATUS = ('new', 'in_progress', 'partially_paid', 'paid')
+
+# what get_entitlement() returns, cached as a tuple
+EntitlementState = namedtuple('EntitlementState', 'subscription_id plan_id quantity status active')
+
+# cached for subscribers without a subscription
+NO_ENTITLEMENT = ()
+
+
+def get_cache_key(subscriber_key):
+    return 'abo:entitlement:%s:%s' % subscriber_key
+
+
+def get_subscriber_key(subscriber):
+    return ContentType.objects.get_for_model(subscriber).pk, subscriber.pk
+
+
+def get_entitlement(subscriber, subscriber_key=None):
+    """
+    Returns the EntitlementState of the current subscription of `subscriber` or None if it never subscribed.
+    `subscriber_key` (content type id, pk) can be given instead of the subscriber.
+    """
+    if subscriber_key is None:
+        subscriber_key = get_subscriber_key(subscriber)
+    cache = get_cache()
+    key = get_cache_key(subscriber_key)
+
+    value = cache.get(key)
+    if value is None:
+        try:
+            entitlement = Entitlement.objects.get(subscriber_type=subscriber_key[0], subscriber_id=subscriber_key[1])
+        except Entitlement.DoesNotExist:
+            value = NO_ENTITLEMENT
+        else:
+            value = get_state(entitlement)
+        cache.set(key, value, settings.ABO_ENTITLEMENT_CACHE_TIMEOUT)
+
+    return EntitlementState(*value) if value else None
+
+
+def get_state(entitlement):
+    return tuple(EntitlementState(
+        entitlement.subscription_id,
+        entitlement.plan_id,
+        entitlement.quantity,
+        entitlement.status,
+        entitlement.active
+    ))
+
+
+def update_entitlement(subscription, status=None):
+    """
+    Stores the state of `subscription` as the entitlement of its subscriber. `status` is the status of its backend
+    subscription, it is looked up if not given. An active subscription isn't replaced by an inactive other one.
+    The cached state is dropped after the commit, the next lookup reads the committed one.
+    """
+    subscriber_key = subscription.get_subscriber_key()
+    if subscriber_key is None:
+        return
+
+    if status is None:
+        status = BackendSubscription.objects.filter(subscription=subscription.pk).order_by('-pk').values_list('status', flat=True).first() or 'new'
+    active = not subscription.deleted and status in ACTIVE_STATUS
+
+    lookup = dict(subscriber_type_id=subscriber_key[0], subscriber_id=subscriber_key[1])
+    values = dict(subscription_id=subscription.pk, plan_id=subscription.plan_id, quantity=subscription.quantity,
+                  status=status, active=active)
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                try:
+                    entitlement = Entitlement.objects.select_for_update().get(**lookup)
+                except Entitlement.DoesNotExist:
+                    entitlement = Entitlement(**lookup)
+                else:
+                    if entitlement.subscription_id != subscription.pk and entitlement.active and not active:
+                        return
+
+                for name, value in values.items():
+                    setattr(entitlement, name, value)
+                entitlement.save()
+            break
+        except IntegrityError:
+            # created concurrently, the second attempt locks and updates that row
+            if attempt:
+                raise
+
+    invalidate(subscriber_key)
+
+
+def invalidate(subscriber_key):
+    """Drops the cached state of `subscriber_key` once the current transaction is committed"""
+    on_commit(lambda: get_cache().delete(get_cache_key(subscriber_key)))
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_entitlement(instance)
+
+
+@receiver(new_subscriptions)
+def subscriptions_created(sender, subscriptions, **kwargs):
+    for subscription in subscriptions:
+        if subscription.pk is not None:
+            update_entitlement(subscription)
+
+
+@receiver(post_delete, sender=Entitlement)
+def entitlement_deleted(sender, instance, **kwargs):
+    invalidate((instance.subscriber_type_id, instance.subscriber_id))
+
+
+@receiver(subscription_canceled)
+def subscription_was_canceled(sender, subscription, **kwargs):
+    update_entitlement(subscription)
+
+
+@receiver(subscription_status_changed)
+def status_changed(sender, backend_subscription, new_status, **kwargs):
+    update_entitlement(backend_subscription.subscription, new_status)
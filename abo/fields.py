@@ -16,14 +16,35 @@ contains fix to allow native postgres JSON field:
 
  def db_type(self, connection):
      return 'json'
+
+and decodes lazily: the text loaded from the database is only parsed when the
+attribute is accessed for the first time, and only written back re-serialized
+if it was accessed. On PostgreSQL, psycopg2 would decode json and jsonb
+columns itself, so on every connection they are registered to be returned as
+text instead. That applies to all json and jsonb columns read through
+Django's connections.
+
+With JSONField(jsonb=True) or the setting ABO_JSONB, PostgreSQL >= 9.4 stores
+the values as jsonb. Keys can be looked up on PostgreSQL:
+
+ BackendEvent.objects.filter(message__event__event_type='subscription.created')
+
+With jsonb, these lookups are turned into containment queries (@>), which
+can use a GIN index on the column.
 """
 
 import six
+import copy
 from decimal import Decimal
+from importlib import import_module
 from django.db import models
+from django.db.backends.signals import connection_created
+from django.db.models.lookups import Lookup, Transform
 from django.conf import settings
 from django.core.serializers.json import DjangoJSONEncoder
 
+from . import settings as abo_settings
+
 try:
     # Django <= 1.6 backwards compatibility
     from django.utils import simplejson as json
@@ -31,13 +52,32 @@ except ImportError:
     # Django >= 1.7
     import json
 
+if abo_settings.ABO_JSON_DECODER:
+    decoder = import_module(abo_settings.ABO_JSON_DECODER)
+else:
+    decoder = json
+
+
+# type oids of json and jsonb in PostgreSQL
+JSON_OIDS = (114, 3802)
+
+
+def register_json_as_text(sender, connection, **kwargs):
+    """Makes psycopg2 return json and jsonb columns of a new connection as text, JSONField decodes them lazily"""
+    if connection.vendor != 'postgresql':
+        return
+    from psycopg2.extensions import new_type, register_type
+    register_type(new_type(JSON_OIDS, 'ABO_JSON_AS_TEXT', lambda value, cursor: value), connection.connection)
+
+connection_created.connect(register_json_as_text)
+
 
 def dumps(value):
     return DjangoJSONEncoder().encode(value)
 
 
 def loads(txt):
-    value = json.loads(
+    value = decoder.loads(
         txt,
         parse_float=Decimal,
         encoding=settings.DEFAULT_CHARSET
@@ -62,11 +102,110 @@ class JSONList(list):
         return dumps(self)
 
 
-class JSONField(six.with_metaclass(models.SubfieldBase, models.TextField)):
+class RawJSON(object):
+    """
+    JSON text that has been loaded from the database but not decoded yet
+    """
+    def __init__(self, text):
+        self.text = text
+
+
+class LazyJSONDescriptor(object):
+    """
+    Stores JSON text assigned to the field as RawJSON and decodes it on first access.
+    """
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.field.attname]
+        if isinstance(value, RawJSON):
+            value = self.field.to_python(value.text)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        if value is None or isinstance(value, six.string_types):
+            value = RawJSON(value)
+        instance.__dict__[self.field.attname] = value
+
+
+class KeyTransform(Transform):
+    """
+    Extracts the value of a key as text. Nested keys are combined into one
+    path, message__event__event_type becomes ("message" #>> '{event,event_type}')
+    """
+    output_field = models.TextField()
+
+    def __init__(self, key_name, *args, **kwargs):
+        super(KeyTransform, self).__init__(*args, **kwargs)
+        self.key_name = key_name
+
+    def get_path(self):
+        """Returns the JSON column and the list of keys"""
+        keys = [self.key_name]
+        column = self.lhs
+        while isinstance(column, KeyTransform):
+            keys.insert(0, column.key_name)
+            column = column.lhs
+        return column, keys
+
+    def as_sql(self, compiler, connection):
+        if connection.vendor != 'postgresql':
+            raise NotImplementedError("JSON key lookups are only supported on PostgreSQL")
+        column, keys = self.get_path()
+        lhs, params = compiler.compile(column)
+        return "(%s #>> %%s)" % lhs, params + [keys]
+
+    def get_transform(self, name):
+        return super(KeyTransform, self).get_transform(name) or KeyTransformFactory(name)
+
+    def relabeled_clone(self, relabels):
+        clone = copy.copy(self)
+        clone.lhs = self.lhs.relabeled_clone(relabels)
+        return clone
+
+
+class KeyTransformFactory(object):
+    def __init__(self, key_name):
+        self.key_name = key_name
+
+    def __call__(self, *args, **kwargs):
+        return KeyTransform(self.key_name, *args, **kwargs)
+
+
+class KeyTransformExact(Lookup):
+    """
+    On jsonb columns message__event__event_type='x' becomes
+    "message" @> '{"event": {"event_type": "x"}}', which can use a GIN index.
+    """
+    lookup_name = 'exact'
+
+    def as_sql(self, compiler, connection):
+        column, keys = self.lhs.get_path()
+        if getattr(column.output_field, 'jsonb', False):
+            lhs, params = compiler.compile(column)
+            value = self.rhs
+            for key in reversed(keys):
+                value = {key: value}
+            return "%s @> %%s::jsonb" % lhs, params + [dumps(value)]
+
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return "%s = %s" % (lhs, rhs), lhs_params + rhs_params
+
+KeyTransform.register_lookup(KeyTransformExact)
+
+
+class JSONField(models.TextField):
     """JSONField is a generic textfield that neatly serializes/unserializes
     JSON objects seamlessly.  Main thingy must be a dict object."""
 
     def __init__(self, *args, **kwargs):
+        jsonb = kwargs.pop('jsonb', None)
+        self.jsonb = abo_settings.ABO_JSONB if jsonb is None else jsonb
         default = kwargs.get('default', None)
         if default is None:
             kwargs['default'] = '{}'
@@ -88,10 +227,21 @@ class JSONField(six.with_metaclass(models.SubfieldBase, models.TextField)):
         else:
             return value
 
+    def contribute_to_class(self, cls, name, *args, **kwargs):
+        super(JSONField, self).contribute_to_class(cls, name, *args, **kwargs)
+        setattr(cls, self.name, LazyJSONDescriptor(self))
+
+    def pre_save(self, model_instance, add):
+        # don't trigger decoding, values that were never accessed are saved as they were loaded
+        return model_instance.__dict__.get(self.attname)
+
     def get_db_prep_save(self, value, connection):
         """Convert our JSON object to a string before we save"""
-        if not isinstance(value, (list, dict)):
-            return super(JSONField, self).get_db_prep_save("", connection=connection)
+        if isinstance(value, RawJSON):
+            return super(JSONField, self).get_db_prep_save(value.text or "{}", connection=connection)
+        elif not isinstance(value, (list, dict)):
+            # "" is not valid in json and jsonb columns
+            return super(JSONField, self).get_db_prep_save("{}", connection=connection)
         else:
             return super(JSONField, self).get_db_prep_save(dumps(value),
                                                            connection=connection)
@@ -105,8 +255,13 @@ class JSONField(six.with_metaclass(models.SubfieldBase, models.TextField)):
         # That's our definition!
         return (field_class, args, kwargs)
 
+    def get_transform(self, name):
+        return super(JSONField, self).get_transform(name) or KeyTransformFactory(name)
+
     def db_type(self, connection):
-        if connection.vendor == 'postgresql' and connection.pg_version > 90200:
+        if connection.vendor == 'postgresql' and self.jsonb and connection.pg_version >= 90400:
+            return 'jsonb'
+        elif connection.vendor == 'postgresql' and connection.pg_version > 90200:
             return 'json'
         else:
             return super(JSONField, self).db_type(connection)
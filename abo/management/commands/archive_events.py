@@ -0,0 +1,37 @@
+from datetime import timedelta
+from optparse import make_option
+
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+
+from abo import settings
+from abo.archive import EventArchiver
+
+
+class Command(BaseCommand):
+    help = 'Moves processed backend events into compressed archive files and deletes them from the DB'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--days', type='int', dest='days', default=settings.ABO_ARCHIVE_AFTER_DAYS,
+                    help='Archive events that are older than DAYS days'),
+        make_option('--directory', dest='directory', default=settings.ABO_ARCHIVE_DIR,
+                    help='Directory the archive files are written to'),
+        make_option('--batch-size', type='int', dest='batch_size', default=1000,
+                    help='Number of events read and deleted per query'),
+        make_option('--max-events', type='int', dest='max_events', default=100000,
+                    help='Maximum number of events per archive file'),
+    )
+
+    def handle(self, *args, **options):
+        if not options['directory']:
+            raise CommandError('Set ABO_ARCHIVE_DIR in your settings or pass --directory')
+
+        archiver = EventArchiver(
+            directory=options['directory'],
+            before=timezone.now() - timedelta(days=options['days']),
+            batch_size=options['batch_size'],
+            max_events=options['max_events']
+        )
+
+        for path in archiver.run():
+            self.stdout.write(path)
@@ -0,0 +1,126 @@
+import time
+import logging
+import threading
+from itertools import groupby
+from optparse import make_option
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+
+from abo import settings
+from abo.models import BackendEvent
+from abo.registry import backends
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Processes all backend events that were received but not processed yet'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size', default=settings.ABO_EVENT_BATCH_SIZE,
+                    help='Number of events a worker claims per transaction'),
+        make_option('--concurrency', type='int', dest='concurrency', default=settings.ABO_EVENT_CONCURRENCY,
+                    help='Number of worker threads, 1 processes events in the current thread. Databases that can\'t '
+                         'lock rows, like SQLite, always use 1'),
+        make_option('--interval', type='float', dest='interval', default=0,
+                    help='Keep running and poll for new events every INTERVAL seconds'),
+    )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.lock = threading.Lock()
+
+        while True:
+            processed = self.drain(options['concurrency'])
+            logger.info('Processed %s events, %s failed', processed, len(self.failed))
+
+            if not options['interval']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
+
+    def drain(self, concurrency):
+        """Processes events until the queue is empty, events that failed in an earlier pass are tried again"""
+        self.failed = set()
+        if concurrency <= 1 or not connection.features.has_select_for_update:
+            # without row locks every worker would claim the same events
+            return self.work()
+
+        counts = []
+        workers = [threading.Thread(target=self.work_in_thread, args=(counts, )) for i in range(concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return sum(counts)
+
+    def work_in_thread(self, counts):
+        try:
+            count = self.work()
+            with self.lock:
+                counts.append(count)
+        finally:
+            # every thread gets its own connection, don't leak it
+            connection.close()
+
+    def work(self):
+        """
+        Claims batches of events and processes them until the queue is empty.
+
+        Events that fail are logged and skipped for the rest of this pass, they stay unprocessed in the DB.
+        """
+        count = 0
+        while True:
+            with self.lock:
+                exclude = list(self.failed)
+
+            with transaction.atomic():
+                events = BackendEvent.objects.claim_unprocessed(self.batch_size, exclude=exclude)
+                count += self.process(events)
+
+            if not events:
+                return count
+
+    def process(self, events):
+        """
+        Hands the events to the processors of their backends. Processors that
+        implement process_batch() get all events of their backend at once.
+        """
+        count = 0
+        events = sorted(events, key=lambda event: event.backend)
+        for backend, backend_events in groupby(events, key=lambda event: event.backend):
+            backend_events = list(backend_events)
+            processor = backends.get_event_processor(backend)
+
+            if hasattr(processor, 'process_batch'):
+                try:
+                    with transaction.atomic():
+                        failed = processor.process_batch(backend_events)
+                except Exception:
+                    logger.exception('Processing a batch of %s events failed, retrying one by one', backend)
+                    # the batch was rolled back, but the instances may have been marked already
+                    for event in backend_events:
+                        event.processed = False
+                else:
+                    with self.lock:
+                        self.failed.update(event.pk for event in failed)
+                    count += len(backend_events) - len(failed)
+                    continue
+
+            count += self.process_single(backend_events)
+        return count
+
+    def process_single(self, events):
+        count = 0
+        for event in events:
+            try:
+                with transaction.atomic():
+                    event.process()
+            except Exception:
+                logger.exception('Processing event %s failed', event.pk)
+                with self.lock:
+                    self.failed.add(event.pk)
+            else:
+                count += 1
+        return count
@@ -7,16 +7,16 @@ class Command(BaseCommand):
     def handle(self, *args, **kwargs):
         backends = import_backend_modules()
 
-        for name, cls_name in backends.iteritems():
+        for name, cls_name in backends.items():
             try:
                 webhook_module = import_name(name + ".webhooks")
 
             except AttributeError:
                 # this module has no webhooks, just ignore it.
-                print "Backend '%s' has no webhooks" % name
+                self.stdout.write("Backend '%s' has no webhooks" % name)
                 continue
 
-            print "Registering webhook for backend '%s'" % name
+            self.stdout.write("Registering webhook for backend '%s'" % name)
             webhook = webhook_module.Webhook()
             webhook.init_webhook()
-            print "Webhook URL: %s" % webhook.get_url()
+            self.stdout.write("Webhook URL: %s" % webhook.get_url())
@@ -0,0 +1,22 @@
+from optparse import make_option
+
+from django.core.management import BaseCommand
+
+from abo import get_plan_model, get_subscription_model
+
+Plan = get_plan_model()
+Subscription = get_subscription_model()
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the totals of all subscriptions of the given plans from the current plan amounts'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--plan', type='int', action='append', dest='plans', default=[],
+                    help='Id of a plan, can be given several times. Defaults to all plans'),
+    )
+
+    def handle(self, *args, **options):
+        plans = Plan.objects.filter(pk__in=options['plans']) if options['plans'] else Plan.objects.all()
+        count = Subscription.objects.reprice(plans.only('pk', 'amount'))
+        self.stdout.write('Repriced %s subscriptions' % count)
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+from optparse import make_option
+
+from django.core.management import BaseCommand, CommandError
+
+from abo.revenue import snapshot, today
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Command(BaseCommand):
+    help = 'Computes the daily revenue snapshots of the given days from the subscriptions'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--from', dest='start', default=None,
+                    help='First day, YYYY-MM-DD. Defaults to today'),
+        make_option('--to', dest='end', default=None,
+                    help='Last day, YYYY-MM-DD. Defaults to today'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            start = parse_date(options['start']) if options['start'] else today()
+            end = parse_date(options['end']) if options['end'] else today()
+        except ValueError as e:
+            raise CommandError(e)
+
+        date = start
+        while date <= end:
+            snapshots = snapshot(date)
+            self.stdout.write('%s: %s snapshots' % (date, len(snapshots)))
+            date += timedelta(days=1)
@@ -0,0 +1,35 @@
+from optparse import make_option
+
+from django.core.management import BaseCommand, CommandError
+
+from abo.utils import import_backend_modules, import_name
+
+
+class Command(BaseCommand):
+    help = 'Updates the local backend tables with the changes on the payment gateways since the last run'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--backend', dest='backend', default=None,
+                    help='Only synchronize this backend, e.g. "abo.backends.paymill"'),
+        make_option('--full', action='store_true', dest='full', default=False,
+                    help='Fetch all objects, not only the ones changed since the last run'),
+    )
+
+    def handle(self, *args, **options):
+        backends = list(import_backend_modules())
+        if options['backend']:
+            if options['backend'] not in backends:
+                raise CommandError("Unknown backend '%s'" % options['backend'])
+            backends = [options['backend']]
+
+        for name in backends:
+            try:
+                sync_module = import_name(name + ".sync")
+            except AttributeError:
+                # this backend can't be synchronized, just ignore it.
+                self.stdout.write("Backend '%s' has no sync" % name)
+                continue
+
+            changes = sync_module.Synchronizer().run(full=options['full'])
+            for resource, count in sorted(changes.items()):
+                self.stdout.write("%s: %s %s changed" % (name, count, resource))
@@ -0,0 +1,142 @@
+"""
+Timing histograms of the checkout steps and of the calls to the payment gateways.
+
+All timings go to the sink configured as ABO_METRICS_SINK, a dotted path to a
+callable sink(name, value, labels), e.g. to forward them to statsd. The
+default sink keeps histograms in memory that the metrics view renders in
+Prometheus text format (enable it with ABO_METRICS_ENABLED). Every process has
+its own histograms, so scrape every process or use a sink that aggregates.
+"""
+import threading
+
+from django.dispatch import receiver
+from django.utils import six
+
+from . import settings
+from .signals import checkout_step, gateway_call
+from .utils import import_name
+
+# seconds
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+
+HELP = {
+    'abo_checkout_step_seconds': 'Duration of the steps of a checkout',
+    'abo_gateway_call_seconds': 'Duration of the calls to the payment gateway',
+    'abo_gateway_response_bytes': 'Size of the responses of the payment gateway',
+}
+
+BUCKETS = {
+    'abo_gateway_response_bytes': (256, 1024, 4096, 16384, 65536, 262144, 1048576),
+}
+
+_lock = threading.Lock()
+_histograms = {}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, six.text_type(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram(object):
+    def __init__(self, name, help='', buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # sorted label items -> bucket counts + [sum, count]
+        self._series = {}
+
+    def observe(self, value, labels=None):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+
+        lines = [
+            '# HELP %s %s' % (self.name, self.help),
+            '# TYPE %s histogram' % self.name,
+        ]
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                lines.append('%s_bucket%s %s' % (self.name, _format_labels(key + (('le', _format_number(bound)), )), count))
+            lines.append('%s_bucket%s %s' % (self.name, _format_labels(key + (('le', '+Inf'), )), series[-1]))
+            lines.append('%s_sum%s %s' % (self.name, _format_labels(key), _format_number(series[-2])))
+            lines.append('%s_count%s %s' % (self.name, _format_labels(key), series[-1]))
+        return lines
+
+
+def get_histogram(name):
+    try:
+        return _histograms[name]
+    except KeyError:
+        with _lock:
+            if name not in _histograms:
+                _histograms[name] = Histogram(name, HELP.get(name, ''), BUCKETS.get(name, DEFAULT_BUCKETS))
+        return _histograms[name]
+
+
+def observe(name, value, labels=None):
+    """The default sink"""
+    get_histogram(name).observe(value, labels)
+
+
+def render():
+    """Returns all histograms in Prometheus text format"""
+    lines = []
+    for name in sorted(_histograms):
+        lines.extend(_histograms[name].render())
+    return u'\n'.join(lines) + u'\n'
+
+
+def reset():
+    """Drops all histograms, e.g. for tests"""
+    with _lock:
+        _histograms.clear()
+
+
+def get_sink():
+    return import_name(settings.ABO_METRICS_SINK)
+
+
+@receiver(checkout_step)
+def checkout_step_timed(sender, backend, step, duration, outcome, error_code=None, **kwargs):
+    get_sink()('abo_checkout_step_seconds', duration, {
+        'backend': backend,
+        'step': step,
+        'outcome': outcome,
+        'error_code': error_code or '',
+    })
+
+
+@receiver(gateway_call)
+def gateway_called(sender, backend, method, duration, status=None, exception=None, payload_size=0, **kwargs):
+    sink = get_sink()
+    sink('abo_gateway_call_seconds', duration, {
+        'backend': backend,
+        'method': method,
+        'status': status or '',
+        'exception': exception or '',
+    })
+    sink('abo_gateway_response_bytes', payload_size, {
+        'backend': backend,
+        'method': method,
+    })
@@ -0,0 +1,69 @@
+from django.utils.functional import cached_property
+
+from . import settings
+from .entitlements import get_entitlement
+from .utils import import_name
+
+
+def get_subscriber(request):
+    """
+    Returns the subscriber of a request: the result of the function configured as ABO_SUBSCRIBER_RESOLVER or the
+    logged in user.
+    """
+    if settings.ABO_SUBSCRIBER_RESOLVER:
+        return import_name(settings.ABO_SUBSCRIBER_RESOLVER)(request)
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated():
+        return None
+    return user
+
+
+class LazyEntitlement(object):
+    """
+    The entitlement of the subscriber of a request, looked up on first use and only once.
+    It is true if the subscriber has an active subscription.
+    """
+    def __init__(self, request):
+        self.request = request
+
+    @cached_property
+    def state(self):
+        subscriber = get_subscriber(self.request)
+        if subscriber is None:
+            return None
+        return get_entitlement(subscriber)
+
+    @property
+    def active(self):
+        return self.state is not None and self.state.active
+
+    @property
+    def plan_id(self):
+        return self.state.plan_id if self.state is not None else None
+
+    @property
+    def quantity(self):
+        return self.state.quantity if self.state is not None else None
+
+    @property
+    def status(self):
+        return self.state.status if self.state is not None else None
+
+    def __bool__(self):
+        return self.active
+    __nonzero__ = __bool__
+
+
+def get_request_entitlement(request):
+    """Returns request.entitlement, also without EntitlementMiddleware"""
+    if not hasattr(request, 'entitlement'):
+        request.entitlement = LazyEntitlement(request)
+    return request.entitlement
+
+
+class EntitlementMiddleware(object):
+    """
+    Sets request.entitlement, see LazyEntitlement. Put it after AuthenticationMiddleware.
+    """
+    def process_request(self, request):
+        request.entitlement = LazyEntitlement(request)
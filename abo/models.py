@@ -1,16 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import uuid
 import logging
 
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, connections, transaction, IntegrityError
 from django.utils.translation import ugettext_lazy as _
 from django.core.urlresolvers import reverse
 from django.contrib.contenttypes import generic
 from django.contrib.contenttypes.models import ContentType
 
 from . import settings, signals
-from .utils import import_name
+from .registry import backends
 from .fields import JSONField
+from .utils import get_message_digest, Case, When, Value
 from .choices import *
 
 logger = logging.getLogger(__name__)
@@ -44,6 +48,58 @@ class Plan(AbstractPlan):
         swappable = 'PLAN_MODEL'
 
 
+def get_total(amount, quantity):
+    """Returns the total of `quantity` x a plan of `amount` cents"""
+    return Decimal(amount) * quantity / 100
+
+
+class SubscriptionManager(models.Manager):
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Like Manager.bulk_create(), but computes the totals like save() does, with one query for the plans that are not
+        loaded yet, and sends the new_subscriptions signal once for all subscriptions instead of new_subscription for
+        every single one. Depending on the database the subscriptions have no pk afterwards.
+        """
+        objs = list(objs)
+        plan_field = self.model._meta.get_field('plan')
+        missing = set(obj.plan_id for obj in objs if not hasattr(obj, plan_field.get_cache_name()))
+        plans = plan_field.rel.to._default_manager.in_bulk(list(missing)) if missing else {}
+        for obj in objs:
+            plan = plans[obj.plan_id] if obj.plan_id in missing else obj.plan
+            obj.total = get_total(plan.amount, obj.quantity)
+
+        objs = super(SubscriptionManager, self).bulk_create(objs, *args, **kwargs)
+        for obj in objs:
+            # saved, like save() marks it, so a later save() is an update and sends no new_subscription
+            obj._state.adding = False
+            obj._loaded_deleted = obj.deleted
+            obj._loaded_total = obj.total
+            obj._loaded_plan_id = obj.plan_id
+            obj._loaded_currency = obj.currency
+        signals.new_subscriptions.send(sender=self.model, subscriptions=objs)
+        return objs
+
+    def reprice(self, plans):
+        """
+        Recomputes the totals of all subscriptions of `plans` from their current amount with a single UPDATE (one per
+        plan on Django < 1.8), e.g. after changing the price of a plan. Sends no signals. Returns the number of
+        updated subscriptions.
+        """
+        prices = dict((plan.pk, get_total(plan.amount, 1)) for plan in plans)
+        if not prices:
+            return 0
+
+        total_field = self.model._meta.get_field('total')
+        if Case is not None:
+            price = Case(*[When(plan=pk, then=Value(unit_price)) for pk, unit_price in prices.items()],
+                         output_field=total_field)
+            return self.filter(plan__in=list(prices)).update(
+                total=models.ExpressionWrapper(models.F('quantity') * price, output_field=total_field)
+            )
+
+        return sum(self.filter(plan=pk).update(total=models.F('quantity') * unit_price) for pk, unit_price in prices.items())
+
+
 class AbstractSubscription(models.Model):
     """
     Represents a subscription, created when a customer subscribes to a plan.
@@ -56,22 +112,85 @@ class AbstractSubscription(models.Model):
     total = models.DecimalField(decimal_places=2, max_digits=8, default=0)
     currency = models.CharField(max_length=3, default='EUR')
     deleted = models.BooleanField(default=False)
-    #TODO: generic foreign key "subscriber"
+    # who subscribed, e.g. a user or an organization
+    subscriber_type = models.ForeignKey(ContentType, null=True, blank=True, related_name='+')
+    subscriber_id = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    subscriber = generic.GenericForeignKey('subscriber_type', 'subscriber_id')
+
+    objects = SubscriptionManager()
 
     class Meta:
         abstract = True
 
     def __init__(self, *args, **kwargs):
-        subscription = super(AbstractSubscription, self).__init__(*args, **kwargs)
-        signals.new_subscription.send(sender=None, subscription=subscription)
-        return subscription
+        super(AbstractSubscription, self).__init__(*args, **kwargs)
+        # to notice changes, not through the attributes so deferred fields aren't loaded
+        self._loaded_deleted = self.__dict__.get('deleted')
+        self._loaded_total = self.__dict__.get('total')
+        self._loaded_plan_id = self.__dict__.get('plan_id')
+        self._loaded_currency = self.__dict__.get('currency')
 
     def __unicode__(self):
         return "%s x '%s', %.2f %s" % (self.quantity, self.plan, self.total, self.currency)
 
     def save(self, *args, **kwargs):
-        self.total = self.quantity * self.plan.amount / 100
-        return super(AbstractSubscription, self).save(*args, **kwargs)
+        created = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        # the plan is only needed if the total can have changed
+        if update_fields is None or set(update_fields) & set(['plan', 'quantity', 'total']):
+            self.total = get_total(self.plan.amount, self.quantity)
+        super(AbstractSubscription, self).save(*args, **kwargs)
+
+        if created:
+            self._loaded_deleted = self.deleted
+            self._loaded_total = self.total
+            self._loaded_plan_id = self.plan_id
+            self._loaded_currency = self.currency
+            signals.new_subscription.send(sender=self.__class__, subscription=self)
+        else:
+            self.send_transitions()
+
+    def get_subscriber_key(self):
+        """
+        Returns (content type id, pk) of the subscriber or None, used for entitlements. Override it if your
+        subscription model references its subscriber differently, e.g. with a foreign key to an organization.
+        """
+        if self.subscriber_type_id is None or self.subscriber_id is None:
+            return None
+        return self.subscriber_type_id, self.subscriber_id
+
+    def send_transitions(self):
+        """
+        Sends subscription_updated if the total, plan or currency and subscription_canceled if the subscription was
+        deleted since it was loaded or saved. Both get the values from before. Called by save(), call it after changing
+        subscriptions with bulk updates.
+        """
+        current = dict(
+            old_total=self.__dict__.get('total'),
+            old_plan_id=self.__dict__.get('plan_id'),
+            old_currency=self.__dict__.get('currency'),
+        )
+        loaded = dict(
+            old_total=self._loaded_total,
+            old_plan_id=self._loaded_plan_id,
+            old_currency=self._loaded_currency,
+        )
+        # deferred fields that weren't loaded can't have changed
+        changed = any(loaded[name] is not None and current[name] is not None and loaded[name] != current[name]
+                      for name in loaded)
+        for name, value in loaded.items():
+            if value is None:
+                loaded[name] = current[name]
+
+        if changed:
+            signals.subscription_updated.send(sender=self.__class__, subscription=self, **loaded)
+        self._loaded_total = current['old_total']
+        self._loaded_plan_id = current['old_plan_id']
+        self._loaded_currency = current['old_currency']
+
+        if self.deleted and self._loaded_deleted is False:
+            signals.subscription_canceled.send(sender=self.__class__, subscription=self, **loaded)
+        self._loaded_deleted = self.deleted
 
 
 class Subscription(AbstractSubscription):
@@ -90,6 +209,7 @@ class BackendModel(models.Model):
 
     class Meta:
         abstract = True
+        unique_together = (('backend', 'external_id'), )
 
 
 class BackendPayment(BackendModel):
@@ -126,6 +246,10 @@ class BackendPlan(BackendModel):
     subscription_count_active = models.IntegerField(_("active subscribers"), null=True)
     subscription_count_inactive = models.IntegerField(_("inactive subscribers"), null=True)
 
+    class Meta(BackendModel.Meta):
+        # there must only be one offer per quantity, see abo.offers
+        unique_together = BackendModel.Meta.unique_together + (('backend', 'plan', 'quantity'), )
+
 
 class BackendSubscription(BackendModel):
     """
@@ -140,24 +264,100 @@ class BackendSubscription(BackendModel):
     next_capture_at = models.DateTimeField(_("next capture on"), null=True)
     canceled_at = models.DateTimeField(_("canceled on"), null=True)
 
+    def __init__(self, *args, **kwargs):
+        super(BackendSubscription, self).__init__(*args, **kwargs)
+        self._loaded_status = self.__dict__.get('status')
+
+    def save(self, *args, **kwargs):
+        super(BackendSubscription, self).save(*args, **kwargs)
+        self.send_transitions()
+
+    def send_transitions(self):
+        """
+        Sends subscription_status_changed if the status changed since it was loaded or saved. Called by save(),
+        call it after changing backend subscriptions with bulk updates.
+        """
+        if self._loaded_status is not None and self.status != self._loaded_status:
+            signals.subscription_status_changed.send(
+                sender=self.__class__,
+                backend_subscription=self,
+                old_status=self._loaded_status,
+                new_status=self.status
+            )
+        self._loaded_status = self.status
+
     def get_absolute_url(self):
         return reverse('abo-success',
                        args={'pk': self.pk})
 
 
+class BackendEventManager(models.Manager):
+    def claim_unprocessed(self, batch_size, exclude=None):
+        """
+        Locks and returns up to `batch_size` unprocessed events, oldest first.
+
+        Has to be called inside a transaction. On PostgreSQL >= 9.5, rows that are already locked by another worker are skipped (FOR UPDATE SKIP LOCKED), so several workers can drain the queue at the same time. Older versions wait for the lock instead.
+        """
+        queryset = self.filter(processed=False)
+        if exclude:
+            queryset = queryset.exclude(pk__in=exclude)
+        queryset = queryset.order_by('created_at', 'pk').select_for_update()[:batch_size]
+
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and connection.pg_version >= 90500:
+            sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+            return list(self.db_manager(queryset.db).raw(sql + ' SKIP LOCKED', params))
+        return list(queryset)
+
+    def is_duplicate(self, backend, digest):
+        """
+        Returns True if an event with the same payload digest is stored.
+        """
+        return self.filter(backend=backend, digest=digest).exists()
+
+    def queue(self, backend, message, event_type, livemode=False):
+        """
+        Stores a received event for process_events. Returns None if it is a retried delivery of a stored event.
+        """
+        digest = get_message_digest(message)
+        if self.is_duplicate(backend, digest):
+            return None
+        try:
+            with transaction.atomic():
+                return self.create(
+                    backend=backend,
+                    # some gateways, like paymill, provide no id for events
+                    external_id=str(uuid.uuid4()),
+                    event_type=event_type,
+                    livemode=livemode,
+                    message=message,
+                    digest=digest
+                )
+        except IntegrityError:
+            # the same delivery arrived twice at the same time, the unique (backend, digest) stored it once
+            return None
+
+
 class BackendEvent(BackendModel):
-    event_type = models.CharField(max_length=250)
+    event_type = models.CharField(max_length=250, db_index=True)
     livemode = models.BooleanField(default=False)
     message = JSONField()
+    digest = models.CharField(_("payload digest"), max_length=64, null=True, blank=True)
     processed = models.BooleanField(default=False)
     content_type = models.ForeignKey(ContentType, null=True)
     object_id = models.PositiveIntegerField(null=True)
     content_object = generic.GenericForeignKey('content_type', 'object_id')
 
+    objects = BackendEventManager()
+
+    class Meta(BackendModel.Meta):
+        unique_together = (('backend', 'external_id'), ('backend', 'digest'))
+        # the queue of unprocessed events, see BackendEventManager.claim_unprocessed()
+        index_together = (('processed', 'created_at'), )
+
     def process(self):
         if not self.processed:
-            backend = import_name(self.backend + ".events")
-            processor = getattr(backend, "EventProcessor")
+            processor = backends.get_event_processor(self.backend)
             processor(self).process()
 
             self.processed = True
@@ -175,6 +375,91 @@ class BackendClient(BackendModel):
     def __unicode__(self):
         return u"%s (%s)" % (self.email or "No Email", self.backend)
 
+
+class BackendSyncState(models.Model):
+    """
+    Remembers up to which point the objects of a backend have been synchronized with the payment gateway, see the sync_backend command.
+    """
+    backend = models.CharField(_("backend"), max_length=50, choices=BACKEND_CHOICES)
+    resource = models.CharField(_("resource"), max_length=50)
+    high_water_mark = models.BigIntegerField(_("high-water mark"), default=0, help_text=_("unix timestamp of the last change seen on the gateway"))
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    class Meta:
+        unique_together = (('backend', 'resource'), )
+
+    def __unicode__(self):
+        return u"%s %s" % (self.backend, self.resource)
+
+
+class Entitlement(models.Model):
+    """
+    The state of the current subscription of a subscriber, denormalized for fast lookups, see abo.entitlements.
+    """
+    subscriber_type = models.ForeignKey(ContentType, related_name='+')
+    subscriber_id = models.PositiveIntegerField()
+    subscription = models.ForeignKey(settings.SUBSCRIPTION_MODEL)
+    plan = models.ForeignKey(settings.PLAN_MODEL)
+    quantity = models.IntegerField()
+    status = models.CharField(_("status"), max_length=20, choices=SUBSCRIPTION_STATUS_CHOICES, default='new')
+    active = models.BooleanField(_("active"), default=False)
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    class Meta:
+        unique_together = (('subscriber_type', 'subscriber_id'), )
+
+    def __unicode__(self):
+        return u"%s %s: %s" % (self.subscriber_type_id, self.subscriber_id, self.status)
+
+
+class RevenueSnapshot(models.Model):
+    """
+    Daily revenue of a plan in a currency, see abo.revenue. `mrr` is the monthly recurring revenue at the end of the
+    day, the other amounts are the changes of the day.
+    """
+    date = models.DateField(_("date"))
+    plan = models.ForeignKey(settings.PLAN_MODEL)
+    currency = models.CharField(max_length=3)
+    subscriptions = models.IntegerField(_("active subscriptions"), default=0)
+    mrr = models.DecimalField(_("monthly recurring revenue"), decimal_places=2, max_digits=12, default=0)
+    new_mrr = models.DecimalField(_("new"), decimal_places=2, max_digits=12, default=0)
+    churned_mrr = models.DecimalField(_("churned"), decimal_places=2, max_digits=12, default=0)
+    expansion_mrr = models.DecimalField(_("expansion"), decimal_places=2, max_digits=12, default=0,
+                                        help_text=_("negative for contraction"))
+
+    class Meta:
+        unique_together = (('date', 'plan', 'currency'), )
+
+    def __unicode__(self):
+        return u"%s %s: %s %s" % (self.date, self.plan_id, self.mrr, self.currency)
+
+
+class PendingCheckout(models.Model):
+    """
+    The progress of a checkout. Every step is recorded in its own short transaction, so no transaction is open during
+    gateway calls and checkouts that died half way can be recovered, see the recover_checkouts command. Deleting the
+    objects it refers to keeps the record, only plans with checkouts can't be deleted.
+    """
+    backend = models.CharField(_("backend"), max_length=50, choices=BACKEND_CHOICES)
+    state = models.CharField(_("state"), max_length=20, choices=CHECKOUT_STATE_CHOICES, default='started')
+    plan = models.ForeignKey(settings.PLAN_MODEL, on_delete=models.PROTECT)
+    quantity = models.IntegerField()
+    email = models.CharField(max_length=300)
+    backend_client = models.ForeignKey(BackendClient, null=True, on_delete=models.SET_NULL)
+    backend_payment = models.ForeignKey(BackendPayment, null=True, on_delete=models.SET_NULL)
+    backend_plan = models.ForeignKey(BackendPlan, null=True, on_delete=models.SET_NULL)
+    subscription = models.ForeignKey(settings.SUBSCRIPTION_MODEL, null=True, on_delete=models.SET_NULL)
+    backend_subscription = models.ForeignKey(BackendSubscription, null=True, on_delete=models.SET_NULL)
+    error_code = models.CharField(_("error code"), max_length=100, blank=True)
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    class Meta:
+        index_together = (('state', 'updated_at'), )
+
+    def __unicode__(self):
+        return u"%s x %s for %s (%s)" % (self.quantity, self.plan, self.email, self.state)
+
 # class BackendTransaction(BackendModel):
 #     amount = models.IntegerField(_('amount in cents'))
 #     origin_amount = models.IntegerField(_('used amount in cents'))  # other currency
@@ -0,0 +1,151 @@
+"""
+Resolves the BackendPlan (the offer on the gateway) for a plan and a quantity.
+
+Backends like Paymill need one offer per quantity of a plan, so the checkout
+looks one up every time. Offers hardly ever change, so they are kept in
+memory for OFFER_LOCAL_TTL seconds and in the shared cache (ABO_CACHE) for
+ABO_OFFER_CACHE_TIMEOUT seconds. Cache entries are dropped when a BackendPlan
+or Plan is saved or deleted.
+
+Creating an offer is guarded by a lock in the shared cache, so concurrent
+checkouts for a new quantity create it exactly once. Without the lock no
+offer is created, the checkout fails with OfferLocked and can be retried:
+
+    resolver = OfferResolver(backend)
+    backend_plan = resolver.get(plan, quantity)
+    if backend_plan is None:
+        locked = resolver.acquire(plan, quantity)
+        try:
+            backend_plan = resolver.get(plan, quantity)
+            if backend_plan is None and not locked:
+                raise OfferLocked(plan, quantity)
+            if backend_plan is None:
+                offer = ...  # create it on the gateway
+                backend_plan = resolver.save(BackendPlan(...))
+        finally:
+            if locked:
+                resolver.release(plan, quantity)
+"""
+import time
+import logging
+
+from django.db import transaction, IntegrityError
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import settings, get_plan_model
+from .models import BackendPlan
+from .utils import get_cache
+
+logger = logging.getLogger(__name__)
+
+Plan = get_plan_model()
+
+OFFER_LOCAL_TTL = 60  # seconds
+LOCK_TIMEOUT = 30  # seconds
+
+# (backend, plan id, quantity) -> (expiry time, BackendPlan)
+_local = {}
+
+
+class OfferLocked(Exception):
+    """Another checkout is still creating the offer, try again later"""
+    def __init__(self, plan, quantity):
+        super(OfferLocked, self).__init__({
+            'exception': 'offer_locked',
+            'error': 'The offer for %s x %s is being created, try again' % (quantity, plan)
+        })
+
+
+def get_cache_key(backend, plan_id, quantity):
+    return 'abo:offer:%s:%s:%s' % (backend, plan_id, quantity)
+
+
+class OfferResolver(object):
+    def __init__(self, backend):
+        self.backend = backend
+        self.cache = get_cache()
+
+    def get(self, plan, quantity):
+        """
+        Returns the BackendPlan for `quantity` x `plan` or None if there is none yet.
+        """
+        key = (self.backend, plan.pk, quantity)
+        try:
+            expires, backend_plan = _local[key]
+            if expires > time.time():
+                return backend_plan
+        except KeyError:
+            pass
+
+        backend_plan = self.cache.get(get_cache_key(*key))
+        if backend_plan is None:
+            try:
+                backend_plan = BackendPlan.objects.filter(backend=self.backend, plan=plan, quantity=quantity)[0]
+            except IndexError:
+                return None
+            self.cache.set(get_cache_key(*key), backend_plan, settings.ABO_OFFER_CACHE_TIMEOUT)
+
+        _local[key] = (time.time() + OFFER_LOCAL_TTL, backend_plan)
+        return backend_plan
+
+    def acquire(self, plan, quantity, wait=True, ttl=LOCK_TIMEOUT):
+        """
+        Waits until no other thread or process is creating an offer for `quantity` x `plan` and locks it.
+        A lock that is not released expires after `ttl` seconds, it has to outlive the creation of the offer.
+
+        Returns whether the lock was taken. After waiting LOCK_TIMEOUT seconds, or right away without `wait`, it
+        gives up and returns False, then the lock belongs to someone else and must not be released, and the offer
+        must not be created.
+        """
+        lock_key = get_cache_key(self.backend, plan.pk, quantity) + ':lock'
+        deadline = time.time() + LOCK_TIMEOUT
+        while not self.cache.add(lock_key, 1, ttl):
+            if not wait:
+                return False
+            if time.time() > deadline:
+                logger.warning('Waited too long for lock %s, giving up', lock_key)
+                return False
+            time.sleep(0.1)
+        return True
+
+    def release(self, plan, quantity):
+        self.cache.delete(get_cache_key(self.backend, plan.pk, quantity) + ':lock')
+
+    def save(self, backend_plan):
+        """
+        Saves a new BackendPlan. If there already is one for the same plan and quantity, that one is returned instead.
+        """
+        try:
+            with transaction.atomic():
+                backend_plan.save()
+        except IntegrityError:
+            backend_plan = BackendPlan.objects.get(
+                backend=backend_plan.backend,
+                plan=backend_plan.plan_id,
+                quantity=backend_plan.quantity
+            )
+        return backend_plan
+
+
+def invalidate(backend, plan_id, quantity):
+    _local.pop((backend, plan_id, quantity), None)
+    get_cache().delete(get_cache_key(backend, plan_id, quantity))
+
+
+def reset():
+    """Empties the in-process cache, e.g. for tests"""
+    _local.clear()
+
+
+@receiver(post_save, sender=BackendPlan)
+@receiver(post_delete, sender=BackendPlan)
+def backend_plan_changed(sender, instance, **kwargs):
+    invalidate(instance.backend, instance.plan_id, instance.quantity)
+
+
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+def plan_changed(sender, instance, **kwargs):
+    for backend, quantity in BackendPlan.objects.filter(plan=instance.pk).values_list('backend', 'quantity'):
+        invalidate(backend, instance.pk, quantity)
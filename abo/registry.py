@@ -0,0 +1,118 @@
+"""
+Registry of the payment backends.
+
+It is populated once, when Django's app registry is ready, so code that runs
+for every request or event only needs dict lookups to find a backend, its
+EventProcessor, the handler of an event type or its settings.
+
+Backends register themselves in their AppConfig.ready():
+
+    from abo.registry import backends
+
+    class MyBackendConfig(AppConfig):
+        def ready(self):
+            from .events import EventProcessor
+            backends.register(self.module, event_processor=EventProcessor)
+
+Backends in ABO_BACKENDS that don't do so are registered by abo itself.
+"""
+import threading
+
+from . import settings
+from .utils import import_name
+
+
+class FrozenDict(dict):
+    """A dict that can't be changed after it has been created"""
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("'%s' object is immutable" % type(self).__name__)
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+
+
+class BackendRegistry(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.modules = {}
+        self.processors = {}
+        self.event_processors = {}
+        self.event_handlers = {}
+        self.settings = {}
+
+    def register(self, module, event_processor=None):
+        """
+        Registers a backend. `module` is the backend package, it has to contain a PaymentProcessor class.
+
+        If no `event_processor` is given, the EventProcessor of the backend's `events` module is used, if there is one.
+        """
+        name = module.__name__
+        if event_processor is None:
+            try:
+                event_processor = getattr(import_name(name + ".events"), "EventProcessor")
+            except (ImportError, AttributeError):
+                pass
+
+        self.modules[name] = module
+        self.processors[name] = module.PaymentProcessor
+        self.settings[name] = FrozenDict(settings.ABO_BACKENDS_SETTINGS.get(name, {}))
+        if event_processor is not None:
+            self.register_event_processor(name, event_processor)
+
+    def register_event_processor(self, backend, event_processor):
+        """
+        Registers the class that processes the events of `backend`. If the class has a get_event_handlers() method, its
+        dispatch table (event_type -> handler) is stored as well.
+        """
+        self.event_processors[backend] = event_processor
+        get_event_handlers = getattr(event_processor, 'get_event_handlers', None)
+        self.event_handlers[backend] = FrozenDict(get_event_handlers() if get_event_handlers else {})
+
+    def populate(self):
+        """Registers all backends in ABO_BACKENDS, that haven't registered themselves"""
+        for name in settings.ABO_BACKENDS:
+            if name not in self.modules:
+                self.register(import_name(name))
+
+    def get_module(self, backend):
+        try:
+            return self.modules[backend]
+        except KeyError:
+            with self.lock:
+                if backend not in self.modules:
+                    self.register(import_name(backend))
+            return self.modules[backend]
+
+    def get_default(self):
+        """Returns the module of ABO_DEFAULT_BACKEND"""
+        return self.get_module(settings.ABO_DEFAULT_BACKEND)
+
+    def get_event_processor(self, backend):
+        try:
+            return self.event_processors[backend]
+        except KeyError:
+            # not necessarily a complete backend, e.g. in tests
+            with self.lock:
+                if backend not in self.event_processors:
+                    self.register_event_processor(backend, getattr(import_name(backend + ".events"), "EventProcessor"))
+            return self.event_processors[backend]
+
+    def get_event_handlers(self, backend):
+        try:
+            return self.event_handlers[backend]
+        except KeyError:
+            self.get_event_processor(backend)
+            return self.event_handlers[backend]
+
+    def get_settings(self, backend):
+        """
+        Returns the (read-only) settings of a backend. If there are none, an empty dict is returned.
+        """
+        try:
+            return self.settings[backend]
+        except KeyError:
+            backend_settings = FrozenDict(settings.ABO_BACKENDS_SETTINGS.get(backend, {}))
+            self.settings[backend] = backend_settings
+            return backend_settings
+
+
+backends = BackendRegistry()
@@ -0,0 +1,195 @@
+"""
+Daily revenue rollups (RevenueSnapshot) per plan and currency.
+
+The snapshot of today is maintained incrementally: a subscription counts
+as new once its first backend subscription is created, i.e. the checkout
+succeeded, and subscription_updated and subscription_canceled change it
+from then on. A switch to another plan or currency churns the old amount
+from the row of the old plan and counts the new amount as new on the row of
+the new one. Every change is a single UPDATE of one row. The first change
+of a day carries the MRR over from the last snapshot of the plan.
+
+Subscriptions without a backend subscription, e.g. of a failed checkout or
+from Subscription.objects.bulk_create(), aren't counted until they get one.
+
+The snapshot_revenue command (re)computes snapshots with aggregate queries,
+e.g. to backfill past days or after changes that send no signals, like
+Subscription.objects.reprice() or backend subscriptions created in bulk.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings as django_settings
+from django.db import transaction, IntegrityError
+from django.db.models import F, Sum, Count
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import get_plan_model, get_subscription_model
+from .models import BackendSubscription, RevenueSnapshot
+from .signals import subscription_updated, subscription_canceled
+
+Plan = get_plan_model()
+Subscription = get_subscription_model()
+
+CENT = Decimal('0.01')
+
+# plan interval -> months
+MONTHS = {
+    'day': Decimal(12) / 365,
+    'week': Decimal(12) / 52,
+    'month': Decimal(1),
+    'year': Decimal(12),
+}
+
+
+def get_monthly(total, interval, interval_count):
+    """Returns the monthly revenue of `total` paid every `interval_count` `interval`s"""
+    return (Decimal(total) / (MONTHS[interval] * (interval_count or 1))).quantize(CENT)
+
+
+def today():
+    return timezone.localtime(timezone.now()).date() if django_settings.USE_TZ else datetime.now().date()
+
+
+def record(plan, currency, date=None, subscriptions=0, mrr=0, new_mrr=0, churned_mrr=0, expansion_mrr=0):
+    """Adds the given changes to the snapshot of `plan` on `date` (default: today)"""
+    date = date or today()
+    changes = dict(
+        subscriptions=F('subscriptions') + subscriptions,
+        mrr=F('mrr') + mrr,
+        new_mrr=F('new_mrr') + new_mrr,
+        churned_mrr=F('churned_mrr') + churned_mrr,
+        expansion_mrr=F('expansion_mrr') + expansion_mrr,
+    )
+    snapshots = RevenueSnapshot.objects.filter(date=date, plan=plan.pk, currency=currency)
+    if snapshots.update(**changes):
+        return
+
+    # first change of the day, start with the state of the last snapshot
+    try:
+        previous = RevenueSnapshot.objects.filter(date__lt=date, plan=plan.pk, currency=currency).latest('date')
+    except RevenueSnapshot.DoesNotExist:
+        previous = RevenueSnapshot()
+    try:
+        with transaction.atomic():
+            RevenueSnapshot.objects.create(
+                date=date, plan_id=plan.pk, currency=currency,
+                subscriptions=previous.subscriptions + subscriptions,
+                mrr=previous.mrr + mrr,
+                new_mrr=new_mrr,
+                churned_mrr=churned_mrr,
+                expansion_mrr=expansion_mrr
+            )
+    except IntegrityError:
+        # created concurrently
+        snapshots.update(**changes)
+
+
+def snapshot(date):
+    """
+    Computes the snapshots of `date` from the subscriptions with a backend subscription that was active at the end
+    of that day, with aggregate queries. Totals are the current ones and expansions are kept, they can't be
+    reconstructed.
+    """
+    start = datetime.combine(date, time.min)
+    if django_settings.USE_TZ:
+        start = timezone.make_aware(start, timezone.get_current_timezone())
+    end = start + timedelta(days=1)
+
+    backend_subscriptions = BackendSubscription.objects.all()
+
+    def aggregate(queryset):
+        # every subscription once, however many backend subscriptions it has
+        subscriptions = Subscription.objects.filter(pk__in=queryset.values('subscription'))
+        return dict(
+            ((row['plan'], row['currency']), row)
+            for row in subscriptions.values('plan', 'currency').annotate(count=Count('pk'), total=Sum('total'))
+        )
+
+    active = aggregate(backend_subscriptions.filter(created_at__lt=end).exclude(canceled_at__lt=end))
+    new = aggregate(backend_subscriptions.filter(created_at__gte=start, created_at__lt=end))
+    churned = aggregate(backend_subscriptions.filter(canceled_at__gte=start, canceled_at__lt=end))
+
+    keys = set(active) | set(new) | set(churned)
+    plans = Plan.objects.in_bulk(list(set(plan_id for plan_id, currency in keys)))
+
+    snapshots = []
+    for plan_id, currency in keys:
+        plan = plans[plan_id]
+
+        def monthly(rows):
+            row = rows.get((plan_id, currency))
+            return get_monthly(row['total'] or 0, plan.interval, plan.interval_count) if row else Decimal(0)
+
+        values = dict(
+            subscriptions=active[(plan_id, currency)]['count'] if (plan_id, currency) in active else 0,
+            mrr=monthly(active),
+            new_mrr=monthly(new),
+            churned_mrr=monthly(churned),
+        )
+        snapshot, created = RevenueSnapshot.objects.get_or_create(date=date, plan_id=plan_id, currency=currency, defaults=values)
+        if not created:
+            for name, value in values.items():
+                setattr(snapshot, name, value)
+            snapshot.save()
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def is_counted(subscription):
+    """Returns whether `subscription` is part of the revenue, i.e. it has a backend subscription"""
+    return BackendSubscription.objects.filter(subscription=subscription.pk).exists()
+
+
+@receiver(post_save, sender=BackendSubscription)
+def backend_subscription_created(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    if BackendSubscription.objects.filter(subscription=instance.subscription_id).exclude(pk=instance.pk).exists():
+        return
+    subscription = instance.subscription
+    if subscription.deleted:
+        return
+    mrr = get_monthly(subscription.total, subscription.plan.interval, subscription.plan.interval_count)
+    record(subscription.plan, subscription.currency, subscriptions=1, mrr=mrr, new_mrr=mrr)
+
+
+def get_old_plan(subscription, old_plan_id):
+    if old_plan_id is None or old_plan_id == subscription.plan_id:
+        return subscription.plan
+    return Plan.objects.get(pk=old_plan_id)
+
+
+def churn(plan, currency, total):
+    mrr = get_monthly(total, plan.interval, plan.interval_count)
+    record(plan, currency, subscriptions=-1, mrr=-mrr, churned_mrr=mrr)
+
+
+@receiver(subscription_updated)
+def subscription_total_changed(sender, subscription, old_total, old_plan_id=None, old_currency=None, **kwargs):
+    if subscription.deleted or not is_counted(subscription):
+        return
+    plan = subscription.plan
+    old_plan = get_old_plan(subscription, old_plan_id)
+    old_currency = old_currency or subscription.currency
+
+    if old_plan.pk != plan.pk or old_currency != subscription.currency:
+        # moved to another row: gone from the old one, new in the new one
+        churn(old_plan, old_currency, old_total)
+        mrr = get_monthly(subscription.total, plan.interval, plan.interval_count)
+        record(plan, subscription.currency, subscriptions=1, mrr=mrr, new_mrr=mrr)
+        return
+
+    change = get_monthly(subscription.total, plan.interval, plan.interval_count) - get_monthly(old_total, plan.interval, plan.interval_count)
+    record(plan, subscription.currency, mrr=change, expansion_mrr=change)
+
+
+@receiver(subscription_canceled)
+def subscription_churned(sender, subscription, old_total, old_plan_id=None, old_currency=None, **kwargs):
+    if not is_counted(subscription):
+        return
+    if old_total is None:
+        old_total = subscription.total
+    churn(get_old_plan(subscription, old_plan_id), old_currency or subscription.currency, old_total)
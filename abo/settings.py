@@ -5,5 +5,34 @@ ABO_BACKENDS = getattr(settings, 'ABO_BACKENDS', tuple())
 ABO_DEFAULT_BACKEND = getattr(settings, 'ABO_DEFAULT_BACKEND', '')
 ABO_BACKENDS_SETTINGS = getattr(settings, 'ABO_BACKENDS_SETTINGS', dict())
 
+ABO_EVENT_BATCH_SIZE = getattr(settings, 'ABO_EVENT_BATCH_SIZE', 100)
+ABO_EVENT_CONCURRENCY = getattr(settings, 'ABO_EVENT_CONCURRENCY', 4)
+ABO_ARCHIVE_DIR = getattr(settings, 'ABO_ARCHIVE_DIR', None)
+ABO_ARCHIVE_AFTER_DAYS = getattr(settings, 'ABO_ARCHIVE_AFTER_DAYS', 90)
+
+# module used to decode JSONFields, it needs a json compatible loads(), e.g. 'simplejson'
+ABO_JSON_DECODER = getattr(settings, 'ABO_JSON_DECODER', None)
+# store JSONFields as jsonb on PostgreSQL >= 9.4
+ABO_JSONB = getattr(settings, 'ABO_JSONB', False)
+
+# cache used for state shared between processes
+ABO_CACHE = getattr(settings, 'ABO_CACHE', 'default')
+ABO_OFFER_CACHE_TIMEOUT = getattr(settings, 'ABO_OFFER_CACHE_TIMEOUT', 24 * 60 * 60)  # seconds
+ABO_CATALOG_CACHE_TIMEOUT = getattr(settings, 'ABO_CATALOG_CACHE_TIMEOUT', 24 * 60 * 60)  # seconds
+# function(request) that returns the subscriber of a request, defaults to the logged in user
+ABO_SUBSCRIBER_RESOLVER = getattr(settings, 'ABO_SUBSCRIBER_RESOLVER', None)
+ABO_ENTITLEMENT_CACHE_TIMEOUT = getattr(settings, 'ABO_ENTITLEMENT_CACHE_TIMEOUT', 24 * 60 * 60)  # seconds
+
+# rows counted at most by the changelists of the big tables in the admin, see abo.admin.EstimatedCountPaginator
+ABO_ADMIN_COUNT_LIMIT = getattr(settings, 'ABO_ADMIN_COUNT_LIMIT', 10000)
+
+# threads per process for the blocking work of the asyncio interface, see abo.aio
+ABO_ASYNC_THREADS = getattr(settings, 'ABO_ASYNC_THREADS', 16)
+
+# callable sink(name, value, labels) that receives all timings, the default keeps histograms in memory
+ABO_METRICS_SINK = getattr(settings, 'ABO_METRICS_SINK', 'abo.metrics.observe')
+# serve the in-memory histograms in Prometheus text format at metrics/
+ABO_METRICS_ENABLED = getattr(settings, 'ABO_METRICS_ENABLED', False)
+
 SUBSCRIPTION_MODEL = getattr(settings, 'SUBSCRIPTION_MODEL', 'abo.Subscription')
 PLAN_MODEL = getattr(settings, 'PLAN_MODEL', 'abo.Plan')
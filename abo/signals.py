@@ -3,5 +3,23 @@ from django.dispatch import Signal
 new_subscription = Signal(providing_args=['subscription'])
 new_subscription.__doc__ = """Sent after creating a subscription"""
 
+new_subscriptions = Signal(providing_args=['subscriptions'])
+new_subscriptions.__doc__ = """Sent once after creating many subscriptions with Subscription.objects.bulk_create()"""
+
+subscription_updated = Signal(providing_args=['subscription', 'old_total', 'old_plan_id', 'old_currency'])
+subscription_updated.__doc__ = """Sent after the total, plan or currency of a subscription changed, e.g. because its quantity changed"""
+
+subscription_canceled = Signal(providing_args=['subscription', 'old_total', 'old_plan_id', 'old_currency'])
+subscription_canceled.__doc__ = """Sent after a subscription was marked as deleted, the old_ values are the ones before that save"""
+
+subscription_status_changed = Signal(providing_args=['backend_subscription', 'old_status', 'new_status'])
+subscription_status_changed.__doc__ = """Sent after the status of a BackendSubscription changed, e.g. from 'new' to 'paid'"""
+
 payment_error = Signal(providing_args=['error_code', 'exception'])
 payment_error.__doc__ = """Is sent whenever an error occurs during payment"""
+
+checkout_step = Signal(providing_args=['backend', 'step', 'duration', 'outcome', 'error_code'])
+checkout_step.__doc__ = """Is sent for every step of a checkout with its duration in seconds, outcome is 'success' or 'error'"""
+
+gateway_call = Signal(providing_args=['backend', 'method', 'duration', 'status', 'exception', 'payload_size'])
+gateway_call.__doc__ = """Is sent after every call to a payment gateway, see abo.tracing"""
@@ -0,0 +1,16 @@
+from django.test import TestCase
+
+from abo import catalog, offers
+from abo.utils import get_cache
+
+
+class CacheResetTestCase(TestCase):
+    """
+    Empties the shared cache (ABO_CACHE) and the in-process caches before every test, the DB is rolled back after
+    every test but the caches are not.
+    """
+    def setUp(self):
+        super(CacheResetTestCase, self).setUp()
+        offers.reset()
+        catalog.reset()
+        get_cache().clear()
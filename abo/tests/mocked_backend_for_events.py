@@ -7,7 +7,7 @@ class events(object):
             self.backend_event = backend_event
 
         def process(self):
-            if self.backend_event.message.get("method") is "new_plan":
+            if self.backend_event.message.get("method") == "new_plan":
                 plan = PlanFactory(name=self.backend_event.message.get("name"))
                 self.backend_event.content_object = plan
                 self.backend_event.save()
@@ -0,0 +1,41 @@
+from django.core.paginator import EmptyPage
+from django.test import TestCase
+
+from abo import settings
+from abo.admin import EstimatedCountPaginator, estimate_count
+from abo.models import BackendEvent
+
+
+class EstimatedCountTestCase(TestCase):
+    def setUp(self):
+        for i in range(5):
+            BackendEvent.objects.create(backend='abo.backends.paymill', external_id='event%s' % i,
+                                        event_type='subscription.created', message={'i': i})
+
+    def test_count_is_limited(self):
+        self.assertEqual(estimate_count(BackendEvent.objects.all(), 3), 3)
+        self.assertEqual(estimate_count(BackendEvent.objects.filter(external_id='event1'), 3), 1)
+
+    def test_page(self):
+        paginator = EstimatedCountPaginator(BackendEvent.objects.order_by('-pk').defer('message'), 2)
+        self.assertEqual(paginator.count, 5)
+
+        page = paginator.page(2)
+        self.assertEqual([event.external_id for event in page.object_list], ['event2', 'event1'])
+        self.assertTrue(page.has_next())
+
+    def test_pages_beyond_the_limit(self):
+        limit, settings.ABO_ADMIN_COUNT_LIMIT = settings.ABO_ADMIN_COUNT_LIMIT, 3
+        try:
+            paginator = EstimatedCountPaginator(BackendEvent.objects.order_by('-pk').defer('message'), 2)
+            self.assertEqual(paginator.count, 3)
+            self.assertEqual(paginator.num_pages, 2)
+
+            page = paginator.page(2)
+            self.assertTrue(page.has_next())
+            page = paginator.page(page.next_page_number())
+            self.assertEqual([event.external_id for event in page.object_list], ['event0'])
+            self.assertFalse(page.has_next())
+            self.assertRaises(EmptyPage, paginator.page, 4)
+        finally:
+            settings.ABO_ADMIN_COUNT_LIMIT = limit
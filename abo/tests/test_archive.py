@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from abo.archive import EventArchiver, read_archive
+from abo.models import BackendEvent
+
+
+class EventArchiverTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for i in range(5):
+            BackendEvent.objects.create(
+                backend="abo.tests.mocked_backend_for_events",
+                external_id=str(i),
+                processed=i < 4,
+                message={"method": "new_plan", "name": "plan %s" % i}
+            )
+        BackendEvent.objects.update(created_at=timezone.now() - timedelta(days=100))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_archive_and_read(self):
+        archiver = EventArchiver(self.directory, before=timezone.now() - timedelta(days=90), batch_size=3, max_events=3)
+
+        paths = archiver.run()
+
+        self.assertEqual(len(paths), 2)
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(os.path.basename(path) for path in paths))
+
+        # the unprocessed event stays
+        self.assertEqual(list(BackendEvent.objects.values_list('external_id', flat=True)), ['4'])
+
+        events = list(read_archive(paths))
+        self.assertEqual([event['external_id'] for event in events], ['0', '1', '2', '3'])
+        self.assertEqual(events[1]['message'], {"method": "new_plan", "name": "plan 1"})
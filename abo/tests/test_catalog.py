@@ -0,0 +1,76 @@
+from django import forms
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from abo import catalog
+from abo.catalog import PlanChoiceField
+from abo.factories import PlanFactory
+from abo.utils import get_cache
+
+
+class PlanForm(forms.Form):
+    plan = PlanChoiceField()
+
+
+class CatalogTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        catalog.reset()
+        self.plan = PlanFactory()
+        self.hidden_plan = PlanFactory(visible=False)
+
+    def test_served_from_memory(self):
+        self.assertEqual([plan.pk for plan in catalog.get_plans()], [self.plan.pk])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.get_plans()[0].name, self.plan.name)
+            self.assertEqual(catalog.get_plan(self.hidden_plan.pk).pk, self.hidden_plan.pk)
+            self.assertEqual(len(catalog.get_plans(hidden=True)), 2)
+
+    def test_form(self):
+        catalog.get_plans()
+
+        with self.assertNumQueries(0):
+            form = PlanForm({'plan': self.plan.pk})
+            self.assertEqual([pk for pk, label in form.fields['plan'].choices], [u"", self.plan.pk])
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['plan'].pk, self.plan.pk)
+
+        self.assertFalse(PlanForm({'plan': self.hidden_plan.pk}).is_valid())
+        self.assertFalse(PlanForm({'plan': 'nope'}).is_valid())
+
+    def test_choices_are_lazy(self):
+        catalog.reset()
+        with self.assertNumQueries(0):
+            field = PlanChoiceField()
+        self.assertEqual([pk for pk, label in field.choices], [u"", self.plan.pk])
+
+
+# the version is bumped after the commit, which TestCase never does
+class CatalogVersionTestCase(TransactionTestCase):
+    def setUp(self):
+        get_cache().clear()
+        catalog.reset()
+        self.plan = PlanFactory()
+
+    def test_bumped_on_change(self):
+        version = catalog.get_version()
+        catalog.get_plans()
+
+        self.plan.name = 'Renamed'
+        self.plan.save()
+        self.assertNotEqual(catalog.get_version(), version)
+        self.assertEqual(catalog.get_plans()[0].name, 'Renamed')
+
+        self.plan.delete()
+        self.assertEqual(catalog.get_plans(), ())
+
+    def test_bumped_after_commit(self):
+        version = catalog.get_version()
+
+        with transaction.atomic():
+            self.plan.name = 'Renamed'
+            self.plan.save()
+            self.assertEqual(catalog.get_version(), version)
+        self.assertNotEqual(catalog.get_version(), version)
+        self.assertEqual(catalog.get_plans()[0].name, 'Renamed')
@@ -0,0 +1,68 @@
+from django.test import TestCase
+from requests import ConnectionError
+
+from abo import tracing
+from abo.circuit import CircuitBreaker, CircuitOpen, GuardedClient
+from abo.utils import get_cache
+
+
+class FlakyClient(object):
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def get_offer(self, id):
+        return self.new_offer(id)
+
+    def new_offer(self, id):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError('connection refused')
+        return id
+
+    def new_card(self, token):
+        raise Exception({'exception': 'field_invalid_card_number', 'error': 'Invalid card number'})
+
+
+class CircuitTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.breaker = CircuitBreaker('test', threshold=3, reset_timeout=30)
+
+    def test_idempotent_calls_are_retried(self):
+        client = FlakyClient(failures=2)
+        self.assertEqual(GuardedClient(client, self.breaker, retries=2, backoff=0).get_offer('offer1'), 'offer1')
+        self.assertEqual(client.calls, 3)
+
+    def test_other_calls_are_not_retried(self):
+        client = FlakyClient(failures=1)
+        self.assertRaises(ConnectionError, GuardedClient(client, self.breaker, retries=2, backoff=0).new_offer, 'offer1')
+        self.assertEqual(client.calls, 1)
+
+    def test_circuit_opens_after_failures(self):
+        client = GuardedClient(FlakyClient(failures=10), self.breaker, backoff=0)
+        for i in range(3):
+            self.assertRaises(ConnectionError, client.new_offer, 'offer1')
+
+        with self.assertRaises(CircuitOpen) as cm:
+            client.new_offer('offer1')
+        self.assertEqual(cm.exception.args[0]['exception'], 'circuit_open')
+
+    def test_declined_cards_are_no_failures(self):
+        client = GuardedClient(FlakyClient(failures=0), self.breaker, backoff=0)
+        for i in range(5):
+            self.assertRaises(Exception, client.new_card, 'xxx123')
+        self.assertEqual(client.new_offer('offer1'), 'offer1')
+
+    def test_status_of_an_earlier_call_is_ignored(self):
+        class Response(object):
+            status_code = 503
+            content = ''
+        # a server error of an earlier call on this thread
+        tracing.response_hook(Response())
+
+        client = GuardedClient(FlakyClient(failures=0), self.breaker, backoff=0)
+        for i in range(5):
+            self.assertRaises(Exception, client.new_card, 'xxx123')
+        self.assertEqual(client.new_offer('offer1'), 'offer1')
+
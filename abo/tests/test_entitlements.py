@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.test import TransactionTestCase
+from django.contrib.contenttypes.models import ContentType
+
+from abo import get_subscription_model
+from abo.entitlements import get_entitlement
+from abo.factories import PlanFactory
+from abo.models import BackendSubscription, BackendPlan, BackendPayment
+from abo.utils import get_cache
+
+Subscription = get_subscription_model()
+
+
+# the cached state is dropped after the commit, which TestCase never does
+class EntitlementTestCase(TransactionTestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.plan = PlanFactory()
+        # any model instance can be a subscriber
+        self.subscriber = PlanFactory()
+
+    def subscribe(self):
+        return Subscription.objects.create(
+            plan=self.plan,
+            quantity=2,
+            subscriber_type=ContentType.objects.get_for_model(self.subscriber),
+            subscriber_id=self.subscriber.pk
+        )
+
+    def test_no_subscription(self):
+        self.assertEqual(get_entitlement(self.subscriber), None)
+
+    def test_lookup_is_cached(self):
+        subscription = self.subscribe()
+
+        with self.assertNumQueries(1):
+            get_entitlement(self.subscriber)
+        with self.assertNumQueries(0):
+            entitlement = get_entitlement(self.subscriber)
+        self.assertEqual(entitlement.subscription_id, subscription.pk)
+        self.assertTrue(entitlement.active)
+
+    def test_cache_is_dropped_after_commit(self):
+        subscription = self.subscribe()
+        self.assertTrue(get_entitlement(self.subscriber).active)
+
+        with transaction.atomic():
+            subscription.deleted = True
+            subscription.save()
+            with self.assertNumQueries(0):
+                self.assertTrue(get_entitlement(self.subscriber).active)
+        self.assertFalse(get_entitlement(self.subscriber).active)
+
+    def test_rollback_keeps_cache(self):
+        subscription = self.subscribe()
+        self.assertTrue(get_entitlement(self.subscriber).active)
+
+        try:
+            with transaction.atomic():
+                subscription.deleted = True
+                subscription.save()
+                raise ValueError
+        except ValueError:
+            pass
+        with self.assertNumQueries(0):
+            self.assertTrue(get_entitlement(self.subscriber).active)
+
+    def test_bulk_created_subscriptions(self):
+        subscription = Subscription(plan=self.plan, quantity=1,
+                                    subscriber_type=ContentType.objects.get_for_model(self.subscriber),
+                                    subscriber_id=self.subscriber.pk)
+        [subscription] = Subscription.objects.bulk_create([subscription])
+        if subscription.pk is None:
+            self.skipTest('the database returns no pks from bulk_create()')
+        self.assertEqual(get_entitlement(self.subscriber).subscription_id, subscription.pk)
+
+    def test_status_transitions(self):
+        subscription = self.subscribe()
+        backend_subscription = BackendSubscription.objects.create(
+            backend='abo.backends.paymill',
+            external_id='subscription1',
+            subscription=subscription,
+            backend_plan=BackendPlan.objects.create(backend='abo.backends.paymill', external_id='offer1', plan=self.plan, quantity=2),
+            backend_payment=BackendPayment.objects.create(backend='abo.backends.paymill', external_id='payment1', payment_type='creditcard'),
+        )
+
+        backend_subscription.status = 'failed'
+        backend_subscription.save()
+        self.assertEqual(get_entitlement(self.subscriber).status, 'failed')
+        self.assertFalse(get_entitlement(self.subscriber).active)
+
+        backend_subscription.status = 'paid'
+        backend_subscription.save()
+        self.assertTrue(get_entitlement(self.subscriber).active)
+
+        subscription.deleted = True
+        subscription.save()
+        self.assertFalse(get_entitlement(self.subscriber).active)
@@ -1,5 +1,9 @@
+import threading
+
+from django.db import connection
 from django.test import TestCase
 
+from abo.management.commands.process_events import Command
 from abo.models import BackendEvent
 
 
@@ -29,3 +33,53 @@ class BackendEventTestCase(TestCase):
 
         self.assertFalse(event.processed)
         self.assertEquals(event.object_id, None)
+
+    def test_failed_events_are_retried_by_the_next_pass(self):
+        event = BackendEvent.objects.create(
+            backend="abo.tests.mocked_backend_for_events",
+            livemode=False,
+            message={"method": "fail", "name": "test123"}
+        )
+        command = Command()
+        command.batch_size = 10
+        command.lock = threading.Lock()
+
+        self.assertEqual(command.drain(1), 0)
+        self.assertEqual(command.failed, set([event.pk]))
+
+        event.message = {"method": "new_plan", "name": "test123"}
+        event.save()
+        self.assertEqual(command.drain(1), 1)
+        self.assertEqual(command.failed, set())
+        self.assertTrue(BackendEvent.objects.get(pk=event.pk).processed)
+
+    def test_single_worker_without_row_locks(self):
+        BackendEvent.objects.create(
+            backend="abo.tests.mocked_backend_for_events",
+            livemode=False,
+            message={"method": "new_plan", "name": "test123"}
+        )
+        command = Command()
+        command.batch_size = 10
+        command.lock = threading.Lock()
+        command.work_in_thread = None  # no threads are started
+
+        supported, connection.features.has_select_for_update = connection.features.has_select_for_update, False
+        try:
+            self.assertEqual(command.drain(4), 1)
+        finally:
+            connection.features.has_select_for_update = supported
+
+    def test_queue_deduplicates(self):
+        message = {"event": {"event_type": "subscription.created", "created_at": 1393435184}}
+        self.assertNotEqual(BackendEvent.objects.queue('abo.backends.paymill', message, 'subscription.created'), None)
+        self.assertEqual(BackendEvent.objects.queue('abo.backends.paymill', message, 'subscription.created'), None)
+
+        # a delivery that passes the check at the same time as another one is stopped by the unique index
+        BackendEvent.objects.is_duplicate = lambda backend, digest: False
+        try:
+            self.assertEqual(BackendEvent.objects.queue('abo.backends.paymill', message, 'subscription.created'), None)
+        finally:
+            del BackendEvent.objects.is_duplicate
+        self.assertEqual(BackendEvent.objects.count(), 1)
+
@@ -0,0 +1,54 @@
+from django.db import connection
+from django.test import TestCase
+from unittest import skipIf
+
+from abo.fields import JSONDict, RawJSON
+from abo.models import BackendEvent
+
+
+class LazyJSONFieldTestCase(TestCase):
+    def setUp(self):
+        BackendEvent.objects.create(
+            backend="abo.tests.mocked_backend_for_events",
+            message={"method": "new_plan", "name": "test123"}
+        )
+
+    def test_decoded_on_first_access(self):
+        event = BackendEvent.objects.get()
+        self.assertIsInstance(event.__dict__['message'], RawJSON)
+
+        self.assertEqual(event.message, {"method": "new_plan", "name": "test123"})
+        self.assertIsInstance(event.__dict__['message'], JSONDict)
+
+    def test_save_without_access(self):
+        event = BackendEvent.objects.get()
+        event.processed = True
+        event.save()
+
+        self.assertEqual(BackendEvent.objects.get().message, {"method": "new_plan", "name": "test123"})
+
+    def test_save_changed_value(self):
+        event = BackendEvent.objects.get()
+        event.message['name'] = "test456"
+        event.save()
+
+        self.assertEqual(BackendEvent.objects.get().message['name'], "test456")
+
+
+@skipIf(connection.vendor != 'postgresql', "JSON key lookups need PostgreSQL")
+class JSONKeyLookupTestCase(TestCase):
+    def test_nested_key_lookup(self):
+        event = BackendEvent.objects.create(
+            backend="abo.backends.paymill",
+            external_id="1",
+            message={"event": {"event_resource": {"subscription": {"id": "subscription1"}}}}
+        )
+        BackendEvent.objects.create(
+            backend="abo.backends.paymill",
+            external_id="2",
+            message={"event": {"event_resource": {"subscription": {"id": "subscription2"}}}}
+        )
+
+        events = BackendEvent.objects.filter(message__event__event_resource__subscription__id="subscription1")
+
+        self.assertEqual(list(events), [event])
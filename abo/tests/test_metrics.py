@@ -0,0 +1,60 @@
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+
+from abo import metrics, settings
+from abo.signals import checkout_step
+from abo.tracing import TracingClient
+
+
+class Client(object):
+    def new_client(self, email):
+        return email
+
+    def new_card(self, token):
+        raise ValueError(token)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_histogram(self):
+        histogram = metrics.Histogram('test_seconds', 'Test', buckets=(0.1, 1))
+        histogram.observe(0.05, {'step': 'client'})
+        histogram.observe(0.5, {'step': 'client'})
+
+        self.assertEqual(histogram.render(), [
+            '# HELP test_seconds Test',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{step="client",le="0.1"} 1',
+            'test_seconds_bucket{step="client",le="1"} 2',
+            'test_seconds_bucket{step="client",le="+Inf"} 2',
+            'test_seconds_sum{step="client"} 0.55',
+            'test_seconds_count{step="client"} 2',
+        ])
+
+    def test_checkout_steps_are_exposed(self):
+        checkout_step.send(sender=None, backend='abo.backends.paymill', step='card', duration=0.3,
+                           outcome='error', error_code='field_invalid_card_number')
+
+        enabled, settings.ABO_METRICS_ENABLED = settings.ABO_METRICS_ENABLED, True
+        try:
+            response = self.client.get(reverse('abo-metrics'))
+        finally:
+            settings.ABO_METRICS_ENABLED = enabled
+
+        self.assertContains(response, 'abo_checkout_step_seconds_count{backend="abo.backends.paymill",'
+                                      'error_code="field_invalid_card_number",outcome="error",step="card"} 1')
+
+    def test_disabled_by_default(self):
+        self.assertEqual(self.client.get(reverse('abo-metrics')).status_code, 404)
+
+    def test_gateway_calls_are_traced(self):
+        client = TracingClient(Client(), 'abo.backends.paymill')
+
+        self.assertEqual(client.new_client(email='test@example.com'), 'test@example.com')
+        self.assertRaises(ValueError, client.new_card, token='xxx123')
+
+        rendered = metrics.render()
+        self.assertIn('abo_gateway_call_seconds_count{backend="abo.backends.paymill",exception="",method="new_client",status=""} 1', rendered)
+        self.assertIn('abo_gateway_call_seconds_count{backend="abo.backends.paymill",exception="ValueError",method="new_card",status=""} 1', rendered)
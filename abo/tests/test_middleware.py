@@ -0,0 +1,59 @@
+from django.test import TransactionTestCase
+from django.test.client import RequestFactory
+from django.http import HttpResponse
+from django.contrib.contenttypes.models import ContentType
+
+from abo import get_subscription_model, settings
+from abo.decorators import subscription_required
+from abo.factories import PlanFactory
+from abo.middleware import EntitlementMiddleware
+from abo.utils import get_cache
+
+Subscription = get_subscription_model()
+
+
+def get_subscriber(request):
+    return request.subscriber
+
+
+@subscription_required
+def view(request):
+    return HttpResponse()
+
+
+class EntitlementMiddlewareTestCase(TransactionTestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.plan = PlanFactory()
+        # any model instance can be a subscriber
+        self.subscriber = PlanFactory()
+        self.resolver, settings.ABO_SUBSCRIBER_RESOLVER = settings.ABO_SUBSCRIBER_RESOLVER, 'abo.tests.test_middleware.get_subscriber'
+
+    def tearDown(self):
+        settings.ABO_SUBSCRIBER_RESOLVER = self.resolver
+
+    def get_request(self):
+        request = RequestFactory().get('/')
+        request.subscriber = self.subscriber
+        EntitlementMiddleware().process_request(request)
+        return request
+
+    def test_resolved_once(self):
+        Subscription.objects.create(plan=self.plan, quantity=1,
+                                    subscriber_type=ContentType.objects.get_for_model(self.subscriber), subscriber_id=self.subscriber.pk)
+        get_cache().clear()
+        request = self.get_request()
+
+        with self.assertNumQueries(1):
+            self.assertTrue(request.entitlement.active)
+            self.assertEqual(request.entitlement.plan_id, self.plan.pk)
+            self.assertEqual(view(request).status_code, 200)
+
+    def test_subscription_required(self):
+        response = view(self.get_request())
+        self.assertEqual(response.status_code, 302)
+
+        Subscription.objects.create(plan=self.plan, quantity=1,
+                                    subscriber_type=ContentType.objects.get_for_model(self.subscriber), subscriber_id=self.subscriber.pk)
+        self.assertEqual(view(self.get_request()).status_code, 200)
+        self.assertEqual(subscription_required(plan=self.subscriber)(view)(self.get_request()).status_code, 302)
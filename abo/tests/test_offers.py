@@ -0,0 +1,68 @@
+from abo import offers
+from abo.factories import PlanFactory
+from abo.models import BackendPlan
+from abo.offers import OfferResolver
+from abo.utils import get_cache
+
+from .base import CacheResetTestCase
+
+
+class OfferResolverTestCase(CacheResetTestCase):
+    def setUp(self):
+        super(OfferResolverTestCase, self).setUp()
+        self.plan = PlanFactory()
+        self.resolver = OfferResolver('abo.backends.paymill')
+
+    def create_backend_plan(self, external_id):
+        return BackendPlan.objects.create(
+            backend='abo.backends.paymill',
+            external_id=external_id,
+            plan=self.plan,
+            quantity=3
+        )
+
+    def test_cached_lookup(self):
+        self.assertEqual(self.resolver.get(self.plan, 3), None)
+        self.create_backend_plan('offer1')
+
+        self.assertEqual(self.resolver.get(self.plan, 3).external_id, 'offer1')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolver.get(self.plan, 3).external_id, 'offer1')
+
+    def test_invalidated_on_delete(self):
+        self.create_backend_plan('offer1')
+        self.resolver.get(self.plan, 3)
+
+        BackendPlan.objects.all().delete()
+
+        self.assertEqual(self.resolver.get(self.plan, 3), None)
+
+    def test_save_returns_existing_offer(self):
+        existing = self.create_backend_plan('offer1')
+
+        backend_plan = self.resolver.save(BackendPlan(
+            backend='abo.backends.paymill',
+            external_id='offer2',
+            plan=self.plan,
+            quantity=3
+        ))
+
+        self.assertEqual(backend_plan.pk, existing.pk)
+        self.assertEqual(BackendPlan.objects.count(), 1)
+
+    def test_lock_is_only_taken_once(self):
+        lock_key = offers.get_cache_key('abo.backends.paymill', self.plan.pk, 3) + ':lock'
+        self.assertTrue(self.resolver.acquire(self.plan, 3))
+
+        timeout = offers.LOCK_TIMEOUT
+        offers.LOCK_TIMEOUT = 0
+        try:
+            # gives up, the lock still belongs to the first caller
+            self.assertFalse(OfferResolver('abo.backends.paymill').acquire(self.plan, 3))
+        finally:
+            offers.LOCK_TIMEOUT = timeout
+        self.assertEqual(get_cache().get(lock_key), 1)
+
+        self.resolver.release(self.plan, 3)
+        self.assertTrue(self.resolver.acquire(self.plan, 3))
+
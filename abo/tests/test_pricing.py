@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from django.test import TestCase
+from django.core.management import call_command
+
+from abo import get_subscription_model
+from abo.factories import PlanFactory
+
+Subscription = get_subscription_model()
+
+
+class PricingTestCase(TestCase):
+    def setUp(self):
+        self.plan = PlanFactory(amount=150)
+        self.other_plan = PlanFactory(amount=1000)
+
+    def test_total(self):
+        subscription = Subscription.objects.create(plan=self.plan, quantity=3)
+        self.assertEqual(subscription.total, Decimal('4.50'))
+
+    def test_bulk_create_computes_totals(self):
+        plan_id = self.other_plan.pk
+        with self.assertNumQueries(2):
+            Subscription.objects.bulk_create([
+                Subscription(plan=self.plan, quantity=2),
+                Subscription(plan_id=plan_id, quantity=2),
+            ])
+
+        self.assertEqual(sorted(Subscription.objects.values_list('total', flat=True)), [Decimal('3.00'), Decimal('20.00')])
+
+    def test_reprice(self):
+        Subscription.objects.create(plan=self.plan, quantity=2)
+        Subscription.objects.create(plan=self.other_plan, quantity=3)
+        self.plan.amount = 200
+        self.plan.save()
+        self.other_plan.amount = 500
+        self.other_plan.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(Subscription.objects.reprice([self.plan, self.other_plan]), 2)
+
+        self.assertEqual(Subscription.objects.get(plan=self.plan).total, Decimal('4.00'))
+        self.assertEqual(Subscription.objects.get(plan=self.other_plan).total, Decimal('15.00'))
+
+    def test_command(self):
+        Subscription.objects.create(plan=self.plan, quantity=2)
+        self.plan.amount = 300
+        self.plan.save()
+
+        call_command('reprice_subscriptions', plans=[self.plan.pk])
+
+        self.assertEqual(Subscription.objects.get().total, Decimal('6.00'))
@@ -0,0 +1,31 @@
+from django.test import TestCase
+
+from abo.registry import BackendRegistry, FrozenDict
+
+
+class BackendRegistryTestCase(TestCase):
+    def setUp(self):
+        self.registry = BackendRegistry()
+
+    def test_event_processor_is_resolved_once(self):
+        processor = self.registry.get_event_processor("abo.tests.mocked_backend_for_events")
+
+        self.assertEqual(processor.__name__, "EventProcessor")
+        self.assertIs(self.registry.event_processors["abo.tests.mocked_backend_for_events"], processor)
+        self.assertEqual(self.registry.get_event_handlers("abo.tests.mocked_backend_for_events"), {})
+
+    def test_paymill_dispatch_table(self):
+        from abo.backends import paymill
+        from abo.backends.paymill.events import EventProcessor
+
+        self.registry.register(paymill)
+
+        self.assertIs(self.registry.get_event_processor("abo.backends.paymill"), EventProcessor)
+        handlers = self.registry.get_event_handlers("abo.backends.paymill")
+        self.assertEqual(handlers[u'subscription.succeeded'], EventProcessor._subscription_succeeded)
+
+    def test_settings_are_read_only(self):
+        backend_settings = self.registry.get_settings("abo.backends.unknown")
+
+        self.assertIsInstance(backend_settings, FrozenDict)
+        self.assertRaises(TypeError, backend_settings.__setitem__, 'KEY', 'value')
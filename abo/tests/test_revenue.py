@@ -0,0 +1,139 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.core.management import call_command
+
+from abo import get_subscription_model
+from abo.factories import PlanFactory
+from abo.models import RevenueSnapshot, BackendSubscription, BackendPlan, BackendPayment
+from abo.revenue import get_monthly, today
+
+Subscription = get_subscription_model()
+
+
+class RevenueTestCase(TestCase):
+    def setUp(self):
+        self.plan = PlanFactory(amount=1000, interval='month', interval_count=1)
+        self.backend_plan = BackendPlan.objects.create(backend='abo.backends.paymill', external_id='offer1', plan=self.plan, quantity=1)
+        self.backend_payment = BackendPayment.objects.create(backend='abo.backends.paymill', external_id='payment1', payment_type='creditcard')
+
+    def activate(self, subscription):
+        return BackendSubscription.objects.create(
+            backend='abo.backends.paymill',
+            external_id='subscription%s' % BackendSubscription.objects.count(),
+            subscription=subscription,
+            backend_plan=self.backend_plan,
+            backend_payment=self.backend_payment,
+        )
+
+    def subscribe(self, quantity):
+        subscription = Subscription.objects.create(plan=self.plan, quantity=quantity, currency='EUR')
+        self.activate(subscription)
+        return subscription
+
+    def get_snapshot(self, date=None):
+        return RevenueSnapshot.objects.get(date=date or today(), plan=self.plan, currency='EUR')
+
+    def test_monthly(self):
+        self.assertEqual(get_monthly(Decimal('120.00'), 'year', 1), Decimal('10.00'))
+        self.assertEqual(get_monthly(Decimal('30.00'), 'month', 3), Decimal('10.00'))
+
+    def test_incremental(self):
+        subscription = self.subscribe(2)
+        self.subscribe(1)
+
+        snapshot = self.get_snapshot()
+        self.assertEqual(snapshot.subscriptions, 2)
+        self.assertEqual(snapshot.mrr, Decimal('30.00'))
+        self.assertEqual(snapshot.new_mrr, Decimal('30.00'))
+
+        subscription.quantity = 3
+        subscription.save()
+        snapshot = self.get_snapshot()
+        self.assertEqual(snapshot.mrr, Decimal('40.00'))
+        self.assertEqual(snapshot.expansion_mrr, Decimal('10.00'))
+
+        subscription.deleted = True
+        subscription.save()
+        snapshot = self.get_snapshot()
+        self.assertEqual(snapshot.subscriptions, 1)
+        self.assertEqual(snapshot.mrr, Decimal('10.00'))
+        self.assertEqual(snapshot.churned_mrr, Decimal('30.00'))
+
+    def test_plan_switch(self):
+        subscription = self.subscribe(2)
+        other_plan = PlanFactory(amount=12000, interval='year', interval_count=1)
+
+        subscription.plan = other_plan
+        subscription.save()
+        snapshot = self.get_snapshot()
+        self.assertEqual(snapshot.subscriptions, 0)
+        self.assertEqual(snapshot.mrr, Decimal('0.00'))
+        self.assertEqual(snapshot.churned_mrr, Decimal('20.00'))
+        self.assertEqual(snapshot.expansion_mrr, Decimal('0.00'))
+
+        other = RevenueSnapshot.objects.get(date=today(), plan=other_plan, currency='EUR')
+        self.assertEqual(other.subscriptions, 1)
+        self.assertEqual(other.mrr, Decimal('20.00'))
+        self.assertEqual(other.new_mrr, Decimal('20.00'))
+
+        # canceled on the new plan afterwards
+        subscription.deleted = True
+        subscription.save()
+        other = RevenueSnapshot.objects.get(date=today(), plan=other_plan, currency='EUR')
+        self.assertEqual(other.subscriptions, 0)
+        self.assertEqual(other.churned_mrr, Decimal('20.00'))
+
+    def test_failed_checkout_is_not_counted(self):
+        subscription = Subscription.objects.create(plan=self.plan, quantity=2, currency='EUR')
+        subscription.deleted = True
+        subscription.save()
+
+        self.assertFalse(RevenueSnapshot.objects.exists())
+
+    def test_counted_once_with_backend_subscription(self):
+        subscription = Subscription.objects.create(plan=self.plan, quantity=2, currency='EUR')
+        self.assertFalse(RevenueSnapshot.objects.exists())
+
+        self.activate(subscription)
+        self.activate(subscription)
+        snapshot = self.get_snapshot()
+        self.assertEqual(snapshot.subscriptions, 1)
+        self.assertEqual(snapshot.new_mrr, Decimal('20.00'))
+
+    def test_cancel_with_changed_total_churns_old_total(self):
+        subscription = self.subscribe(2)
+
+        subscription.quantity = 3
+        subscription.deleted = True
+        subscription.save()
+        snapshot = self.get_snapshot()
+        self.assertEqual(snapshot.subscriptions, 0)
+        self.assertEqual(snapshot.mrr, Decimal('0.00'))
+        self.assertEqual(snapshot.churned_mrr, Decimal('20.00'))
+        self.assertEqual(snapshot.expansion_mrr, Decimal('0.00'))
+
+    def test_carries_over_mrr(self):
+        RevenueSnapshot.objects.create(date=today() - timedelta(days=3), plan=self.plan, currency='EUR',
+                                       subscriptions=4, mrr=Decimal('40.00'), new_mrr=Decimal('10.00'))
+        self.subscribe(1)
+
+        snapshot = self.get_snapshot()
+        self.assertEqual(snapshot.subscriptions, 5)
+        self.assertEqual(snapshot.mrr, Decimal('50.00'))
+        self.assertEqual(snapshot.new_mrr, Decimal('10.00'))
+
+    def test_snapshot_command(self):
+        subscription = self.subscribe(2)
+        # a second backend subscription doesn't count the subscription twice
+        self.activate(subscription)
+        RevenueSnapshot.objects.all().delete()
+
+        call_command('snapshot_revenue')
+
+        snapshot = self.get_snapshot()
+        self.assertEqual(snapshot.subscriptions, 1)
+        self.assertEqual(snapshot.mrr, Decimal('20.00'))
+        self.assertEqual(snapshot.new_mrr, Decimal('20.00'))
+        self.assertEqual(snapshot.churned_mrr, Decimal('0.00'))
@@ -0,0 +1,61 @@
+from django.test import TestCase
+
+from abo import get_subscription_model, signals
+from abo.factories import PlanFactory, SubscriptionFactory
+
+Subscription = get_subscription_model()
+
+
+class SubscriptionSignalsTestCase(TestCase):
+    def setUp(self):
+        self.received = []
+
+    def receiver(self, signal, **kwargs):
+        self.received.append((signal, kwargs))
+
+    def connect(self, signal):
+        signal.connect(self.receiver)
+        self.addCleanup(signal.disconnect, self.receiver)
+
+    def test_new_subscription_only_on_creation(self):
+        self.connect(signals.new_subscription)
+
+        subscription = SubscriptionFactory()
+        list(Subscription.objects.all())
+        subscription.save()
+
+        self.assertEqual(len(self.received), 1)
+        self.assertEqual(self.received[0][1]['subscription'], subscription)
+
+    def test_subscription_canceled(self):
+        subscription = SubscriptionFactory()
+        self.connect(signals.subscription_canceled)
+
+        subscription = Subscription.objects.get(pk=subscription.pk)
+        subscription.deleted = True
+        subscription.save()
+        subscription.save()
+
+        self.assertEqual(len(self.received), 1)
+
+    def test_bulk_create(self):
+        plan = PlanFactory()
+        self.connect(signals.new_subscription)
+        self.connect(signals.new_subscriptions)
+
+        Subscription.objects.bulk_create([Subscription(plan=plan, quantity=i) for i in range(1, 4)])
+
+        self.assertEqual(len(self.received), 1)
+        self.assertEqual(len(self.received[0][1]['subscriptions']), 3)
+
+    def test_save_after_bulk_create(self):
+        plan = PlanFactory()
+        subscriptions = Subscription.objects.bulk_create([Subscription(plan=plan, quantity=2)])
+        if subscriptions[0].pk is None:
+            self.skipTest('the database returns no pks from bulk_create()')
+        self.connect(signals.new_subscription)
+        self.connect(signals.subscription_updated)
+
+        subscriptions[0].save()
+
+        self.assertEqual(self.received, [])
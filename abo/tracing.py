@@ -0,0 +1,78 @@
+"""
+Traces the calls to the payment gateways.
+
+Clients wrapped in a TracingClient send a gateway_call signal for every call
+of a public method with its duration, the HTTP status of the last response,
+the exception raised, if any, and the size of the responses. abo.metrics turns
+them into histograms per backend and method.
+
+Status and size are collected by response_hook, which has to be added to the
+response hooks of the requests session used by the client.
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+from .signals import gateway_call
+
+_local = threading.local()
+
+
+def response_hook(response, *args, **kwargs):
+    """requests response hook, remembers status and size of the responses of the current call"""
+    _local.status = response.status_code
+    _local.size = getattr(_local, 'size', 0) + len(response.content or '')
+
+
+def get_last_status():
+    """Returns the HTTP status of the last response of the current thread's last call, if any"""
+    return getattr(_local, 'status', None)
+
+
+def reset():
+    """Forgets status and size of the current thread's last call, before a new one"""
+    _local.status = None
+    _local.size = 0
+
+
+@contextmanager
+def trace(backend, method):
+    """Sends a gateway_call signal for the gateway requests made in the block"""
+    reset()
+    exception = None
+    start = time.time()
+    try:
+        yield
+    except Exception as e:
+        exception = e
+        raise
+    finally:
+        gateway_call.send(
+            sender=None,
+            backend=backend,
+            method=method,
+            duration=time.time() - start,
+            status=_local.status,
+            exception=type(exception).__name__ if exception is not None else None,
+            payload_size=_local.size
+        )
+
+
+class TracingClient(object):
+    """
+    Proxy for a gateway client that traces the calls of its public methods.
+    """
+    def __init__(self, client, backend):
+        self._client = client
+        self._backend = backend
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def traced(*args, **kwargs):
+            with trace(self._backend, name):
+                return attr(*args, **kwargs)
+        traced.__name__ = name
+        return traced
@@ -14,6 +14,7 @@ from .views import (
     ChangeCardView,
     ChangePlanView,
     HistoryView,
+    MetricsView,
     SubscribeView,
     SubscriptionSuccessView,
     SubscriptionFailureView
@@ -27,5 +28,6 @@ urlpatterns = patterns('',
     url(r"^change/plan/$", ChangePlanView.as_view(), name="abo-change_plan"),
     url(r"^cancel/$", CancelView.as_view(), name="abo-cancel"),
     url(r"^history/$", HistoryView.as_view(), name="abo-history"),
+    url(r"^metrics/$", MetricsView.as_view(), name="abo-metrics"),
     *backend_specific_urls
 )
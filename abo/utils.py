@@ -1,4 +1,15 @@
 import sys
+import hashlib
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+try:
+    from django.db.models import Case, When, Value
+except ImportError:
+    # Django < 1.8
+    Case = When = Value = None
 
 from . import settings
 
@@ -54,13 +65,108 @@ def get_backend_settings(backend):
     """
     Returns backend settings. If it does not exist it fails back to empty dict().
     """
-    backends_settings = getattr(settings, 'ABO_BACKENDS_SETTINGS', {})
-    try:
-        return backends_settings[backend]
-    except KeyError:
-        return {}
+    from .registry import backends
+    return backends.get_settings(backend)
 
 
 def get_default_backend():
     """Returns default backend module"""
-    return import_name(getattr(settings, 'ABO_DEFAULT_BACKEND'))
+    from .registry import backends
+    return backends.get_default()
+
+
+def get_cache():
+    """
+    Returns the cache abo keeps state in that is shared between processes (setting ABO_CACHE)
+    """
+    try:
+        from django.core.cache import caches
+    except ImportError:
+        # Django < 1.7
+        from django.core.cache import get_cache
+        return get_cache(settings.ABO_CACHE)
+    return caches[settings.ABO_CACHE]
+
+
+def on_commit(func, using=None):
+    """
+    Calls `func` once the current transaction is committed, right away if none is open, and not at all if it is
+    rolled back. Use it for changes outside the database, like the cache, that must not show uncommitted state.
+
+    Django >= 1.9 (or django-transaction-hooks) does this with connection.on_commit(). On older versions the commit
+    of the outermost atomic block runs the callbacks; there, callbacks added in a savepoint that was rolled back run
+    as well.
+    """
+    connection = transaction.get_connection(using)
+    if hasattr(connection, 'on_commit'):
+        connection.on_commit(func)
+    elif not connection.in_atomic_block:
+        func()
+    else:
+        _get_commit_hooks(connection).append(func)
+
+
+def _get_commit_hooks(connection):
+    """Returns the callbacks to run after the commit of `connection`, hooks into its commit() and rollback()"""
+    hooks = connection.__dict__.get('abo_commit_hooks')
+    if hooks is None:
+        hooks = connection.abo_commit_hooks = []
+        commit, rollback = connection.commit, connection.rollback
+
+        def commit_and_run_hooks():
+            commit()
+            pending = hooks[:]
+            del hooks[:]
+            for func in pending:
+                func()
+
+        def rollback_and_drop_hooks():
+            del hooks[:]
+            rollback()
+
+        connection.commit = commit_and_run_hooks
+        connection.rollback = rollback_and_drop_hooks
+    return hooks
+
+
+def get_message_digest(message):
+    """
+    Returns a SHA-256 hex digest of a decoded message. Keys are sorted and
+    whitespace is removed first, so equal payloads always get the same digest.
+    """
+    normalized = DjangoJSONEncoder(sort_keys=True, separators=(',', ':')).encode(message)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def bulk_update(objs, fields):
+    """
+    Writes the values of `fields` of the model instances `objs` back to the DB.
+
+    With Django >= 1.8 this is a single UPDATE ... CASE statement. Older
+    versions get one UPDATE for every distinct combination of values, which
+    is still few queries for typical state changes like "status = 'paid'".
+    """
+    objs = [obj for obj in objs if obj.pk is not None]
+    if not objs:
+        return
+
+    model = type(objs[0])
+    manager = model._default_manager
+    model_fields = [model._meta.get_field(name) for name in fields]
+
+    if Case is not None:
+        manager.filter(pk__in=[obj.pk for obj in objs]).update(**dict(
+            (field.name, Case(*[When(pk=obj.pk, then=Value(getattr(obj, field.attname), output_field=field)) for obj in objs],
+                              output_field=field))
+            for field in model_fields
+        ))
+        return
+
+    groups = defaultdict(list)
+    for obj in objs:
+        groups[tuple(getattr(obj, field.attname) for field in model_fields)].append(obj.pk)
+
+    for values, pks in groups.items():
+        manager.filter(pk__in=pks).update(**dict(
+            (field.name, value) for field, value in zip(model_fields, values)
+        ))
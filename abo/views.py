@@ -1,12 +1,11 @@
-from django.views.generic import TemplateView
+from django.http import Http404, HttpResponse
+from django.views.generic import TemplateView, View
 from django.views.generic.base import RedirectView
 
 
-from . import get_plan_model
-from .utils import get_default_backend
-
-
-Plan = get_plan_model()
+from . import settings, metrics, catalog
+from .middleware import get_request_entitlement
+from .registry import backends
 
 
 class PaymentsContextMixin(object):
@@ -14,8 +13,9 @@ class PaymentsContextMixin(object):
     def get_context_data(self, **kwargs):
         context = super(PaymentsContextMixin, self).get_context_data(**kwargs)
         context.update({
-            "PLAN_CHOICES": Plan.objects.all(),
-            "BACKEND": get_default_backend()
+            "PLAN_CHOICES": catalog.get_plans(),
+            "BACKEND": backends.get_default(),
+            "ENTITLEMENT": get_request_entitlement(self.request)
         })
         return context
 
@@ -25,10 +25,20 @@ class SubscribeView(RedirectView):
     permanent = False
 
     def get_redirect_url(self, *args, **kwargs):
-        backend = get_default_backend()
+        backend = backends.get_default()
         url, _, _ = backend.PaymentProcessor.get_gateway_url(None)
         return url
 
+
+class MetricsView(View):
+    """The in-memory histograms in Prometheus text format, only if ABO_METRICS_ENABLED"""
+
+    def get(self, request, *args, **kwargs):
+        if not settings.ABO_METRICS_ENABLED:
+            raise Http404
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # class SubscribeView(PaymentsContextMixin, TemplateView):
 #     template_name = "subscribe.html"
 